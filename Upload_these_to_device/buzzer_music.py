@@ -7,130 +7,8 @@ https://github.com/james1236/buzzer_music
 """
 
 from machine import Pin, PWM
-from math import ceil
+from songs import tones, compile_song
 
-tones = {
-    'C0':16,
-    'C#0':17,
-    'D0':18,
-    'D#0':19,
-    'E0':21,
-    'F0':22,
-    'F#0':23,
-    'G0':24,
-    'G#0':26,
-    'A0':28,
-    'A#0':29,
-    'B0':31,
-    'C1':33,
-    'C#1':35,
-    'D1':37,
-    'D#1':39,
-    'E1':41,
-    'F1':44,
-    'F#1':46,
-    'G1':49,
-    'G#1':52,
-    'A1':55,
-    'A#1':58,
-    'B1':62,
-    'C2':65,
-    'C#2':69,
-    'D2':73,
-    'D#2':78,
-    'E2':82,
-    'F2':87,
-    'F#2':92,
-    'G2':98,
-    'G#2':104,
-    'A2':110,
-    'A#2':117,
-    'B2':123,
-    'C3':131,
-    'C#3':139,
-    'D3':147,
-    'D#3':156,
-    'E3':165,
-    'F3':175,
-    'F#3':185,
-    'G3':196,
-    'G#3':208,
-    'A3':220,
-    'A#3':233,
-    'B3':247,
-    'C4':262,
-    'C#4':277,
-    'D4':294,
-    'D#4':311,
-    'E4':330,
-    'F4':349,
-    'F#4':370,
-    'G4':392,
-    'G#4':415,
-    'A4':440,
-    'A#4':466,
-    'B4':494,
-    'C5':523,
-    'C#5':554,
-    'D5':587,
-    'D#5':622,
-    'E5':659,
-    'F5':698,
-    'F#5':740,
-    'G5':784,
-    'G#5':831,
-    'A5':880,
-    'A#5':932,
-    'B5':988,
-    'C6':1047,
-    'C#6':1109,
-    'D6':1175,
-    'D#6':1245,
-    'E6':1319,
-    'F6':1397,
-    'F#6':1480,
-    'G6':1568,
-    'G#6':1661,
-    'A6':1760,
-    'A#6':1865,
-    'B6':1976,
-    'C7':2093,
-    'C#7':2217,
-    'D7':2349,
-    'D#7':2489,
-    'E7':2637,
-    'F7':2794,
-    'F#7':2960,
-    'G7':3136,
-    'G#7':3322,
-    'A7':3520,
-    'A#7':3729,
-    'B7':3951,
-    'C8':4186,
-    'C#8':4435,
-    'D8':4699,
-    'D#8':4978,
-    'E8':5274,
-    'F8':5588,
-    'F#8':5920,
-    'G8':6272,
-    'G#8':6645,
-    'A8':7040,
-    'A#8':7459,
-    'B8':7902,
-    'C9':8372,
-    'C#9':8870,
-    'D9':9397,
-    'D#9':9956,
-    'E9':10548,
-    'F9':11175,
-    'F#9':11840,
-    'G9':12544,
-    'G#9':13290,
-    'A9':14080,
-    'A#9':14917,
-    'B9':15804
-}
 
 #Time, Note, Duration, Instrument (onlinesequencer.net schematic format)
 #0 D4 8 0;0 D5 8 0;0 G4 8 0;8 C5 2 0;10 B4 2 0;12 G4 2 0;14 F4 1 0;15 G4 17 0;16 D4 8 0;24 C4 8 0
@@ -147,48 +25,53 @@ class music:
         self.timer = -1
         self.beat = -1
         self.arpnote = 0
-        
-        self.pwms = []
+        self.clock = None
         
         if (not (pin is None)):
             pins = [pin]
         self.pins = pins
-        for pin in pins:
-            self.pwms.append(PWM(pin))
+        self.init_pwms()
         
-        self.notes = []
-
-        self.playingNotes = []
-        self.playingDurations = []
-
-
-        #Find the end of the song
-        self.end = 0
-        splitSong = self.song.split(";")
-        for note in splitSong:
-            snote = note.split(" ")
-            testEnd = round(float(snote[0])) + ceil(float(snote[2]))
-            if (testEnd > self.end):
-                self.end = testEnd
-                
-        #Create empty song structure
-        while (self.end > len(self.notes)):
-            self.notes.append(None)
-
-        #Populate song structure with the notes
-        for note in splitSong:
-            snote = note.split(" ")
-            beat = round(float(snote[0]));
-            
-            if (self.notes[beat] == None):
-                self.notes[beat] = []
-            self.notes[beat].append([snote[1],ceil(float(snote[2]))]) #Note, Duration
-
-
-        #Round up end of song to nearest bar
-        self.end = ceil(self.end / 8) * 8
+        self.playingNotes = ()
+
+        #Songs are parsed once and cached, a compiled Song can be passed instead of the string
+        if isinstance(songString, str):
+            self.song = compile_song(songString)
+        self.end = self.song.end
+        #Notes playing on every beat, walked by tick() instead of counting down note durations
+        (self.firstEvents, self.loopEvents) = self.song.timeline()
+        self.events = self.firstEvents
+    
+    def init_pwms(self):
+        self.pwms = []
+        self.duties = []
+        for pin in self.pins:
+            pwm = PWM(pin)
+            self.pwms.append(pwm)
+            #Look up the duty method once instead of on every tick
+            if hasattr(pwm, 'duty_u16'):
+                self.duties.append(pwm.duty_u16)
+            else:
+                self.duties.append(pwm.duty)
+    
+    def start(self, clock, beat_ms):
+        #Play on a hardware timer instead of calling tick() from the game loop. The timer runs
+        #tempo ticks per beat so the speed of the song doesn't depend on the frame rate.
+        self.stop_clock()
+        self.clock = clock
+        self.clock.init(period=max(1, beat_ms // self.tempo), mode=clock.PERIODIC, callback=self.on_clock)
+    
+    def stop_clock(self):
+        if self.clock is not None:
+            self.clock.deinit()
+            self.clock = None
+    
+    def on_clock(self, clock):
+        if not self.tick():
+            self.stop_clock()
     
     def stop(self):
+        self.stop_clock()
         for pwm in self.pwms:
             pwm.deinit()
         self.stopped = True
@@ -196,17 +79,16 @@ class music:
     def restart(self):
         self.beat = -1
         self.timer = 0
-        self.stop()
-        self.pwms = []
-        for pin in self.pins:
-            self.pwms.append(PWM(pin))
+        self.events = self.firstEvents
+        for pwm in self.pwms:
+            pwm.deinit()
+        self.init_pwms()
         self.stopped = False
 
     def resume(self):
-        self.stop()
-        self.pwms = []
-        for pin in self.pins:
-            self.pwms.append(PWM(pin))
+        for pwm in self.pwms:
+            pwm.deinit()
+        self.init_pwms()
         self.stopped = False
 
     def tick(self):
@@ -220,71 +102,35 @@ class music:
                     return False
                 self.beat = -1
                 self.timer = 0
+                self.events = self.loopEvents
             
             #On Beat
             if (self.timer % self.tempo == 0):
                 self.beat = self.beat + 1
-
-                #Remove expired notes from playing list
-                i = 0
-                while (i < len(self.playingDurations)):
-                    self.playingDurations[i] = self.playingDurations[i] - 1
-                    if (self.playingDurations[i] <= 0):
-                        self.playingNotes.pop(i)
-                        self.playingDurations.pop(i)
-                    else:
-                        i = i + 1
-                        
-                #Add new notes and their durations to the playing list
-                
-                """
-                #Old method runs for every note, slow to process on every beat and causes noticeable delay
-                ssong = song.split(";")
-                for note in ssong:
-                    snote = note.split(" ")
-                    if int(snote[0]) == beat:
-                        playingNotes.append(snote[1])
-                        playingDurations.append(int(snote[2]))
-                """
-                
-                if (self.beat < len(self.notes)):
-                    if (self.notes[self.beat] != None):
-                        for note in self.notes[self.beat]:
-                            self.playingNotes.append(note[0])
-                            self.playingDurations.append(note[1])
+                self.playingNotes = self.events[self.beat]
                 
                 #Only need to run these checks on beats
                 i = 0
                 for pwm in self.pwms:
                     if (i >= len(self.playingNotes)):
-                        if hasattr(pwm, 'duty_u16'):
-                            pwm.duty_u16(0)
-                        else:
-                            pwm.duty(0)
+                        self.duties[i](0)
                     else:
                         #Play note
-                        if hasattr(pwm, 'duty_u16'):
-                            pwm.duty_u16(self.duty)
-                        else:
-                            pwm.duty(self.duty)
-                        pwm.freq(tones[self.playingNotes[i]])
+                        self.duties[i](self.duty)
+                        pwm.freq(self.playingNotes[i])
                     i = i + 1
             
 
             #Play arp of all playing notes
             if (len(self.playingNotes) > len(self.pwms)):
-                p = self.pwms[len(self.pwms)-1];
-                if hasattr(p, 'duty_u16'):
-                    p.duty_u16(self.duty)
-                else:
-                    p.duty(self.duty)
+                last = len(self.pwms)-1
+                self.duties[last](self.duty)
                 
                 if (self.arpnote > len(self.playingNotes)-len(self.pwms)):
                     self.arpnote = 0
-                self.pwms[len(self.pwms)-1].freq(tones[self.playingNotes[self.arpnote+(len(self.pwms)-1)]])
+                self.pwms[last].freq(self.playingNotes[self.arpnote+last])
                 self.arpnote = self.arpnote + 1
                 
             return True
         else:
             return False
-
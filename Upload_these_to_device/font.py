@@ -1,9 +1,65 @@
 import framebuf
+
+# Glyphs of all fonts are kept in RAM once per process and shared by every Font.
+# size: (file, bytes per glyph, width, height, first char, layout in the file)
+FONTS = {16: ('ASC16', 16, 8, 16, 0, framebuf.MONO_HLSB),
+         24: ('ASC24', 36, 12, 24, 32, framebuf.MONO_VLSB),
+         32: ('ASC32', 64, 16, 32, 0, framebuf.MONO_HLSB)}
+
+class GlyphStore(object):
+    def __init__(self, native=True):
+        # native: convert glyphs to MONO_VLSB (the SSD1306 layout) the first time they are used
+        self.native = native
+        self.data = {}
+        self.glyphs = {}
+
+    def load(self, size):
+        # read the whole font file once, the file is closed right away
+        if size not in self.data:
+            with open(FONTS[size][0], 'rb') as f:
+                f.seek(0, 2)
+                data = bytearray(f.tell())  # FrameBuffer needs a writable buffer
+                f.seek(0)
+                f.readinto(data)
+            self.data[size] = data
+        return self.data[size]
+
+    def glyph(self, size, alp, layout=None):
+        # Returns a cached FrameBuffer for the character or None if the font doesn't have it.
+        # layout overrides the layout of the file, the glyph is then never converted.
+        key = ord(alp) | (size << 16) | ((0 if layout is None else layout + 1) << 24)  # int key, no allocation
+        if key in self.glyphs:
+            return self.glyphs[key]
+        fb = self.make_glyph(size, alp, layout)
+        self.glyphs[key] = fb
+        return fb
+
+    def make_glyph(self, size, alp, layout):
+        (file, length, width, height, first, file_layout) = FONTS[size]
+        data = self.load(size)
+        start = (ord(alp) - first) * length
+        if start < 0 or start + length > len(data):
+            return None
+        # FrameBuffer over a slice of the font data, no copy
+        fb = framebuf.FrameBuffer(memoryview(data)[start:start + length], width, height,
+                                  file_layout if layout is None else layout)
+        if layout is None and self.native and file_layout != framebuf.MONO_VLSB:
+            native = framebuf.FrameBuffer(bytearray(width * ((height + 7) // 8)), width, height, framebuf.MONO_VLSB)
+            native.blit(fb, 0, 0)
+            fb = native
+        return fb
+
+store = None
+
+def glyph_store():
+    global store
+    if store is None:
+        store = GlyphStore()
+    return store
+
 class Font(object):
     def __init__(self,display):
-        self.file24 = open('ASC24', 'rb')
-        self.file32 = open('ASC32', 'rb')
-        self.file16 = open('ASC16', 'rb')
+        self.store = glyph_store()
         self.display=display
     def text(self,tx,x,y,size=16):
         for i in tx:
@@ -28,28 +84,18 @@ class Font(object):
             self.f16t(i,x,y)
             x=x+8
 
+    def blit(self,fb,x,y):
+        if fb is not None:
+            self.display.blit(fb, x, y)
     def f8(self,alp,x,y):
         self.display.text(alp,x,y,1)
     def f16(self,alp,x,y):
-        self.file16.seek(ord(alp) * 16)
-        font_code = self.file16.read(16)
-        fb = framebuf.FrameBuffer(bytearray(font_code), 8, 16, framebuf.MONO_HLSB)
-        self.display.blit(fb, x, y)
+        self.blit(self.store.glyph(16, alp), x, y)
     def f16t(self,alp,x,y):
-        self.file16.seek(ord(alp) * 16)
-        font_code = self.file16.read(16)
-        fb = framebuf.FrameBuffer(bytearray(font_code), 8, 16, framebuf.MONO_HMSB)
-        self.display.blit(fb, x, y)
+        self.blit(self.store.glyph(16, alp, framebuf.MONO_HMSB), x, y)
     def f24(self,alp,x,y):
-        self.file24.seek((ord(alp)-32) * 36)
-        font_code = self.file24.read(36)
-        fb = framebuf.FrameBuffer(bytearray(font_code), 12, 24, framebuf.MONO_VLSB)
-        self.display.blit(fb, x, y)
+        self.blit(self.store.glyph(24, alp), x, y)
     def f32(self,alp,x,y):
-        self.file32.seek((ord(alp)) * 64)
-        font_code = self.file32.read(64)
-        fb = framebuf.FrameBuffer(bytearray(font_code), 16, 32, framebuf.MONO_HLSB)
-        self.display.blit(fb, x, y)
+        self.blit(self.store.glyph(32, alp), x, y)
     def show(self):
         self.display.show()
-    
\ No newline at end of file
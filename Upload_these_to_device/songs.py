@@ -0,0 +1,245 @@
+"""
+Compiled songs for buzzer_music.
+An onlinesequencer.net song string is parsed once into arrays of note frequencies and
+durations grouped by beat. Parsed songs are cached by their source string, and songs
+compiled on a PC with tools/compile_songs.py are loaded from a file without parsing.
+Doesn't use the machine module so it also runs on a PC.
+"""
+
+from array import array
+from binascii import crc32
+from math import ceil
+
+tones = {
+    'C0':16,
+    'C#0':17,
+    'D0':18,
+    'D#0':19,
+    'E0':21,
+    'F0':22,
+    'F#0':23,
+    'G0':24,
+    'G#0':26,
+    'A0':28,
+    'A#0':29,
+    'B0':31,
+    'C1':33,
+    'C#1':35,
+    'D1':37,
+    'D#1':39,
+    'E1':41,
+    'F1':44,
+    'F#1':46,
+    'G1':49,
+    'G#1':52,
+    'A1':55,
+    'A#1':58,
+    'B1':62,
+    'C2':65,
+    'C#2':69,
+    'D2':73,
+    'D#2':78,
+    'E2':82,
+    'F2':87,
+    'F#2':92,
+    'G2':98,
+    'G#2':104,
+    'A2':110,
+    'A#2':117,
+    'B2':123,
+    'C3':131,
+    'C#3':139,
+    'D3':147,
+    'D#3':156,
+    'E3':165,
+    'F3':175,
+    'F#3':185,
+    'G3':196,
+    'G#3':208,
+    'A3':220,
+    'A#3':233,
+    'B3':247,
+    'C4':262,
+    'C#4':277,
+    'D4':294,
+    'D#4':311,
+    'E4':330,
+    'F4':349,
+    'F#4':370,
+    'G4':392,
+    'G#4':415,
+    'A4':440,
+    'A#4':466,
+    'B4':494,
+    'C5':523,
+    'C#5':554,
+    'D5':587,
+    'D#5':622,
+    'E5':659,
+    'F5':698,
+    'F#5':740,
+    'G5':784,
+    'G#5':831,
+    'A5':880,
+    'A#5':932,
+    'B5':988,
+    'C6':1047,
+    'C#6':1109,
+    'D6':1175,
+    'D#6':1245,
+    'E6':1319,
+    'F6':1397,
+    'F#6':1480,
+    'G6':1568,
+    'G#6':1661,
+    'A6':1760,
+    'A#6':1865,
+    'B6':1976,
+    'C7':2093,
+    'C#7':2217,
+    'D7':2349,
+    'D#7':2489,
+    'E7':2637,
+    'F7':2794,
+    'F#7':2960,
+    'G7':3136,
+    'G#7':3322,
+    'A7':3520,
+    'A#7':3729,
+    'B7':3951,
+    'C8':4186,
+    'C#8':4435,
+    'D8':4699,
+    'D#8':4978,
+    'E8':5274,
+    'F8':5588,
+    'F#8':5920,
+    'G8':6272,
+    'G#8':6645,
+    'A8':7040,
+    'A#8':7459,
+    'B8':7902,
+    'C9':8372,
+    'C#9':8870,
+    'D9':9397,
+    'D#9':9956,
+    'E9':10548,
+    'F9':11175,
+    'F#9':11840,
+    'G9':12544,
+    'G#9':13290,
+    'A9':14080,
+    'A#9':14917,
+    'B9':15804
+}
+
+
+#Binary song file: magic, end of the song in beats, number of beats, number of notes (little endian uint16),
+#crc32 of the song string it was compiled from (little endian uint32)
+#followed by the index of the first note of every beat (beats + 1 uint16), note frequencies and note durations
+MAGIC = b'BZM2'
+
+class Song:
+    def __init__(self, end, starts, freqs, durations):
+        self.end = end  # length of the song rounded up to a full bar
+        self.beats = len(starts) - 1
+        self.starts = starts  # notes of beat b are starts[b] until starts[b + 1]
+        self.freqs = freqs
+        self.durations = durations
+        self.events = None
+
+    def timeline(self):
+        # The notes playing on every beat as tuples of frequencies, computed once.
+        # Returns (first, looped): notes can still be playing when the song loops
+        # so the beats of a repeated song can differ from the first time.
+        if self.events is None:
+            playing = []
+            first = self.play_beats(playing)
+            self.events = (first, self.play_beats(playing))
+        return self.events
+
+    def play_beats(self, playing):
+        events = []
+        for beat in range(self.end):
+            #Remove expired notes, then add the notes starting on this beat
+            i = 0
+            while (i < len(playing)):
+                playing[i][1] = playing[i][1] - 1
+                if (playing[i][1] <= 0):
+                    playing.pop(i)
+                else:
+                    i = i + 1
+            if (beat < self.beats):
+                for i in range(self.starts[beat], self.starts[beat + 1]):
+                    playing.append([self.freqs[i], self.durations[i]])
+            events.append(tuple([note[0] for note in playing]))
+        return events
+
+cache = {}
+
+def compile_song(songString, file=None):
+    # file is the song compiled by tools/compile_songs.py, the string is parsed when it wasn't
+    # uploaded or was compiled from another version of the song
+    song = cache.get(songString)
+    if song is None:
+        if file is not None:
+            try:
+                song = load_song(file, songString)
+            except OSError:
+                pass
+            except ValueError as e:
+                print(e)
+        if song is None:
+            song = parse_song(songString)
+        cache[songString] = song
+    return song
+
+def parse_song(songString):
+    notes = []
+    end = 0
+    for note in songString.split(";"):
+        snote = note.split(" ")
+        beat = round(float(snote[0]))
+        duration = ceil(float(snote[2]))
+        if (beat + duration > end):
+            end = beat + duration
+        notes.append((beat, tones[snote[1]], duration))
+
+    #Group the notes by beat keeping the order of the song within a beat
+    starts = array('H', [0] * (end + 1))
+    for note in notes:
+        starts[note[0] + 1] += 1
+    for beat in range(end):
+        starts[beat + 1] += starts[beat]
+    freqs = array('H', [0] * len(notes))
+    durations = array('H', [0] * len(notes))
+    position = list(starts)
+    for (beat, freq, duration) in notes:
+        freqs[position[beat]] = freq
+        durations[position[beat]] = duration
+        position[beat] += 1
+
+    #Round up end of song to nearest bar
+    return Song(ceil(end / 8) * 8, starts, freqs, durations)
+
+def read_array(f, length):
+    values = array('H', [0] * length)
+    f.readinto(values)
+    return values
+
+def source_crc(songString):
+    return crc32(songString.encode()) & 0xFFFFFFFF
+
+def load_song(file, songString=None):
+    # with songString the file must have been compiled from it
+    with open(file, 'rb') as f:
+        header = f.read(14)
+        if header[:4] != MAGIC:
+            raise ValueError(file + ' is not a song file')
+        end = header[4] | header[5] << 8
+        beats = header[6] | header[7] << 8
+        count = header[8] | header[9] << 8
+        source = header[10] | header[11] << 8 | header[12] << 16 | header[13] << 24
+        if songString is not None and source != source_crc(songString):
+            raise ValueError(file + ' was compiled from another song, compile it again')
+        return Song(end, read_array(f, beats + 1), read_array(f, count), read_array(f, count))
@@ -1,5 +1,6 @@
 # MicroPython SSD1306 OLED driver, I2C and SPI interfaces
 
+import micropython
 from micropython import const
 import framebuf
 
@@ -22,6 +23,16 @@ SET_DISP_CLK_DIV = const(0xD5)
 SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
+SET_SCROLL_RIGHT = const(0x26)
+SET_SCROLL_LEFT = const(0x27)
+SET_SCROLL_VERT_RIGHT = const(0x29)
+SET_SCROLL_VERT_LEFT = const(0x2A)
+SET_SCROLL_OFF = const(0x2E)
+SET_SCROLL_ON = const(0x2F)
+SET_VERT_SCROLL_AREA = const(0xA3)
+
+# commands are queued and sent together, this many bytes at most in one transaction
+CMD_QUEUE_SIZE = const(32)
 
 # Subclassing FrameBuffer provides support for graphics primitives
 # http://docs.micropython.org/en/latest/pyboard/library/framebuf.html
@@ -33,6 +44,15 @@ class SSD1306(framebuf.FrameBuffer):
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
+        # command queue, byte 0 is kept for the I2C control byte
+        self.cmd_buf = bytearray(CMD_QUEUE_SIZE + 1)
+        self.cmd_count = 0
+        self.cmd_views = [None] * (CMD_QUEUE_SIZE + 2)  # memoryviews of the queue by end index
+        # shadow copy of the panel RAM, only allocated when partial updates are enabled
+        self.shadow = None
+        self.shadow_valid = False
+        self.bytes_sent = 0
+        self.pages_skipped = 0
         self.init_display()
 
     def init_display(self):
@@ -68,10 +88,51 @@ class SSD1306(framebuf.FrameBuffer):
             0x10 if self.external_vcc else 0x14,
             SET_DISP | 0x01,
         ):  # on
-            self.write_cmd(cmd)
+            self.queue_cmd(cmd)
+        self.flush_cmds()
         self.fill(0)
+        self.shadow_valid = False
         self.show()
 
+    def set_partial(self, enable):
+        # In partial mode show() compares the buffer with a copy of what was last
+        # sent and only transfers the changed column span of each changed page.
+        if enable:
+            if self.shadow is None:
+                self.shadow = bytearray(len(self.buffer))
+        else:
+            self.shadow = None
+        self.shadow_valid = False
+
+    def reset_stats(self):
+        self.bytes_sent = 0
+        self.pages_skipped = 0
+
+    # Commands are collected with queue_cmd() and sent in a single transaction by flush_cmds(),
+    # the queue is flushed by itself when it is full.
+    def queue_cmd(self, cmd):
+        if self.cmd_count == CMD_QUEUE_SIZE:
+            self.flush_cmds()
+        self.cmd_count += 1
+        self.cmd_buf[self.cmd_count] = cmd
+
+    def flush_cmds(self):
+        if self.cmd_count:
+            self.write_cmds(self.cmd_count)
+            self.cmd_count = 0
+
+    def cmd_view(self, start, end):
+        # memoryview of cmd_buf[start:end], made once per length so sending doesn't allocate
+        view = self.cmd_views[end]
+        if view is None:
+            view = memoryview(self.cmd_buf)[start:end]
+            self.cmd_views[end] = view
+        return view
+
+    def write_cmd(self, cmd):
+        self.queue_cmd(cmd)
+        self.flush_cmds()
+
     def poweroff(self):
         self.write_cmd(SET_DISP | 0x00)
 
@@ -79,40 +140,123 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(SET_DISP | 0x01)
 
     def contrast(self, contrast):
-        self.write_cmd(SET_CONTRAST)
-        self.write_cmd(contrast)
+        self.queue_cmd(SET_CONTRAST)
+        self.queue_cmd(contrast)
+        self.flush_cmds()
 
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
+    # Effects done by the panel itself for a few command bytes. A scroll runs on the panel
+    # until scroll_stop(). The RAM must not be written while it scrolls and the scroll moves
+    # the content of the RAM, so scroll_stop() makes the next show() send the whole frame.
+    # interval is the 3 bit step interval code of the datasheet, in frames of the panel:
+    # 0: 5, 1: 64, 2: 128, 3: 256, 4: 3, 5: 4, 6: 25, 7: 2
+    def scroll_horizontal(self, left, start_page=0, end_page=None, interval=7):
+        self.queue_cmd(SET_SCROLL_OFF)  # the scroll setup may only change while stopped
+        self.queue_cmd(SET_SCROLL_LEFT if left else SET_SCROLL_RIGHT)
+        self.queue_cmd(0x00)
+        self.queue_cmd(start_page)
+        self.queue_cmd(interval)
+        self.queue_cmd(self.pages - 1 if end_page is None else end_page)
+        self.queue_cmd(0x00)
+        self.queue_cmd(0xFF)
+        self.queue_cmd(SET_SCROLL_ON)
+        self.flush_cmds()
+
+    def scroll_diagonal(self, left, vertical_offset, start_page=0, end_page=None, interval=7):
+        # the columns of the pages start_page..end_page move one step sideways and the whole
+        # screen moves vertical_offset rows up on every step
+        self.queue_cmd(SET_SCROLL_OFF)
+        self.queue_cmd(SET_VERT_SCROLL_AREA)
+        self.queue_cmd(0)
+        self.queue_cmd(self.height)
+        self.queue_cmd(SET_SCROLL_VERT_LEFT if left else SET_SCROLL_VERT_RIGHT)
+        self.queue_cmd(0x00)
+        self.queue_cmd(start_page)
+        self.queue_cmd(interval)
+        self.queue_cmd(self.pages - 1 if end_page is None else end_page)
+        self.queue_cmd(vertical_offset)
+        self.queue_cmd(SET_SCROLL_ON)
+        self.flush_cmds()
+
+    def scroll_stop(self):
+        self.write_cmd(SET_SCROLL_OFF)
+        self.shadow_valid = False
+
+    def start_line(self, line):
+        # the RAM row shown at the top of the screen, the screen wraps around
+        self.write_cmd(SET_DISP_START_LINE | (line & 0x3F))
+
+    def set_window(self, x0, x1, page0, page1):
+        self.queue_cmd(SET_COL_ADDR)
+        self.queue_cmd(x0)
+        self.queue_cmd(x1)
+        self.queue_cmd(SET_PAGE_ADDR)
+        self.queue_cmd(page0)
+        self.queue_cmd(page1)
+        self.flush_cmds()
+
     def show(self):
+        if self.shadow is not None and self.shadow_valid:
+            self.show_partial()
+            return
         x0 = 0
         x1 = self.width - 1
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
             x0 += 32
             x1 += 32
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
+        self.set_window(x0, x1, 0, self.pages - 1)
         self.write_data(self.buffer)
+        self.bytes_sent += len(self.buffer)
+        if self.shadow is not None:
+            self.shadow[:] = self.buffer
+            self.shadow_valid = True
+
+    def show_partial(self):
+        offset = 32 if self.width == 64 else 0
+        buf = memoryview(self.buffer)
+        for page in range(self.pages):
+            start = page * self.width
+            span = _dirty_span(self.buffer, self.shadow, start, start + self.width)
+            if span < 0:
+                self.pages_skipped += 1
+                continue
+            c0 = span >> 8
+            c1 = span & 0xFF
+            self.set_window(offset + c0, offset + c1, page, page)
+            self.write_data(buf[start + c0:start + c1 + 1])
+            self.shadow[start + c0:start + c1 + 1] = buf[start + c0:start + c1 + 1]
+            self.bytes_sent += c1 - c0 + 1
+
+
+# Returns the first and last changed column of a page packed as (first << 8) | last,
+# or -1 if the page is identical to its shadow copy
+@micropython.native
+def _dirty_span(buf, shadow, start, end):
+    first = start
+    while first < end and buf[first] == shadow[first]:
+        first += 1
+    if first == end:
+        return -1
+    last = end - 1
+    while buf[last] == shadow[last]:
+        last -= 1
+    return ((first - start) << 8) | (last - start)
 
 
 class SSD1306_I2C(SSD1306):
     def __init__(self, width, height, i2c, addr=0x3C, external_vcc=False):
         self.i2c = i2c
         self.addr = addr
-        self.temp = bytearray(2)
         self.write_list = [b"\x40", None]  # Co=0, D/C#=1
         super().__init__(width, height, external_vcc)
 
-    def write_cmd(self, cmd):
-        self.temp[0] = 0x80  # Co=1, D/C#=0
-        self.temp[1] = cmd
-        self.i2c.writeto(self.addr, self.temp)
+    def write_cmds(self, count):
+        # Co=0, D/C#=0: all the following bytes are commands
+        self.cmd_buf[0] = 0x00
+        self.i2c.writeto(self.addr, self.cmd_view(0, count + 1))
 
     def write_data(self, buf):
         self.write_list[1] = buf
@@ -126,6 +270,7 @@ class SSD1306_SPI(SSD1306):
         res.init(res.OUT, value=0)
         cs.init(cs.OUT, value=1)
         self.spi = spi
+        self.spi.init(baudrate=self.rate, polarity=0, phase=0)  # once, the display owns the bus
         self.dc = dc
         self.res = res
         self.cs = cs
@@ -138,16 +283,15 @@ class SSD1306_SPI(SSD1306):
         self.res(1)
         super().__init__(width, height, external_vcc)
 
-    def write_cmd(self, cmd):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+    def write_cmds(self, count):
+        # no control byte, D/C# is low for commands
         self.cs(1)
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(self.cmd_view(1, count + 1))
         self.cs(1)
 
     def write_data(self, buf):
-        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
         self.cs(1)
         self.dc(1)
         self.cs(0)
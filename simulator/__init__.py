@@ -0,0 +1,10 @@
+"""
+Headless simulator for running the game on a PC.
+
+simulator/device has stand-ins for the MicroPython modules the game imports (machine, framebuf,
+micropython). The real ssd1306 driver talks to a virtual panel over the I2C stand-in.
+"""
+
+from simulator.clock import clock, VirtualClock, TimeModule
+from simulator.panel import VirtualSSD1306, save_png
+from simulator.runner import Simulator
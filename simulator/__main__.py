@@ -0,0 +1,56 @@
+"""
+python -m simulator --ms 20000 --press 2000:400 --press 5000 --png frames
+
+Runs the game for --ms milliseconds of game time with the scripted button presses
+(ms from the start, optionally :duration in ms) and saves the frames as PNG files.
+"""
+
+import argparse
+import time
+
+from simulator.runner import Simulator
+
+
+def parse_press(text):
+    (at, _, duration) = text.partition(':')
+    return (int(at), int(duration) if duration else 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the game headless')
+    parser.add_argument('--ms', type=int, default=10000, help='game time to run in ms')
+    parser.add_argument('--press', type=parse_press, action='append', default=[],
+                        help='button press as time_ms[:duration_ms], can be repeated')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random')
+    parser.add_argument('--png', help='directory for the PNG frames')
+    parser.add_argument('--every', type=int, default=1, help='save every n-th frame')
+    parser.add_argument('--scale', type=int, default=4, help='PNG pixels per panel pixel')
+    parser.add_argument('--verbose', action='store_true', help='show the prints of the game')
+    parser.add_argument('--ascii', action='store_true', help='print the last frame')
+    parser.add_argument('--pipelined', action='store_true', help='send the frames from a second thread')
+    parser.add_argument('--record', help='record the presses to this file')
+    parser.add_argument('--replay', help='play a recording, it ends at the end of the recording or after --ms')
+    args = parser.parse_args()
+
+    sim = Simulator(seed=args.seed, quiet=not args.verbose, capture=args.png is not None,
+                    pipelined=args.pipelined, record=args.record, replay=args.replay)
+    sim.script(args.press)
+    start = time.perf_counter()
+    sim.run(args.ms)
+    elapsed = time.perf_counter() - start
+    if args.record:
+        sim.stop_recording()
+        print(f'recorded {sim.game.tick_count} ticks to {args.record}')
+    print(f'{sim.draws} frames in {sim.time_ms()} ms of game time, {elapsed:.2f} s on the host '
+          f'({args.ms / 1000 / max(elapsed, 1e-9):.1f}x real time)')
+    print(f'i2c: {sim.i2c.bytes_written} bytes in {sim.i2c.transactions} transfers')
+    if args.png:
+        names = sim.save_frames(args.png, args.scale, args.every)
+        print(f'saved {len(names)} frames to {args.png}')
+    if args.ascii:
+        print(sim.screen())
+    sim.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Virtual clock for the simulator.
+
+Time only moves when the game sleeps or when the simulator advances it, so the game runs as
+fast as the host can run it. Timers (machine.Timer) and scheduled events fire while the clock
+advances, in time order, like soft interrupts between two lines of the game.
+"""
+
+import heapq
+import itertools
+
+# MicroPython ticks wrap around like on the device
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now_us = 0
+        self.events = []  # heap of (time_us, sequence, callback)
+        self.sequence = itertools.count()
+
+    def reset(self):
+        self.now_us = 0
+        self.events = []
+
+    def call_at(self, time_us, callback):
+        # callback() runs when the clock reaches time_us, returns a handle for cancel()
+        event = [time_us, next(self.sequence), callback]
+        heapq.heappush(self.events, event)
+        return event
+
+    def call_later(self, delay_us, callback):
+        return self.call_at(self.now_us + delay_us, callback)
+
+    def cancel(self, event):
+        if event is not None:
+            event[2] = None
+
+    def advance(self, us):
+        # moves the clock forward firing every event that becomes due on the way
+        end = self.now_us + max(0, int(us))
+        while self.events and self.events[0][0] <= end:
+            (time_us, _, callback) = heapq.heappop(self.events)
+            if callback is None:
+                continue
+            self.now_us = max(self.now_us, time_us)
+            callback()
+        self.now_us = end
+
+    # the MicroPython time module
+    def ticks_us(self):
+        return self.now_us & TICKS_MAX
+
+    def ticks_ms(self):
+        return (self.now_us // 1000) & TICKS_MAX
+
+    def ticks_cpu(self):
+        return self.ticks_us()
+
+    def ticks_add(self, ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(self, ticks1, ticks2):
+        return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    def sleep_us(self, us):
+        self.advance(us)
+
+    def sleep_ms(self, ms):
+        self.advance(ms * 1000)
+
+    def sleep(self, seconds):
+        self.advance(seconds * 1000000)
+
+    def time(self):
+        return self.now_us // 1000000
+
+    def time_ns(self):
+        return self.now_us * 1000
+
+
+clock = VirtualClock()
+
+
+class TimeModule:
+    # stands in for the time module of the game, game.time = TimeModule(clock)
+    def __init__(self, clock):
+        for name in ('ticks_us', 'ticks_ms', 'ticks_cpu', 'ticks_add', 'ticks_diff',
+                     'sleep_us', 'sleep_ms', 'sleep', 'time', 'time_ns'):
+            setattr(self, name, getattr(clock, name))
@@ -0,0 +1,224 @@
+"""
+Stand-in for the framebuf module, following the C implementation of MicroPython.
+
+Supports the MONO_VLSB, MONO_HLSB and MONO_HMSB formats the game uses, plus GS8.
+Coordinates must be ints like on the device, floats raise TypeError.
+text() uses an 8x8 font made from the ASC16 font of the game, so its glyphs are
+close to but not the same as the built-in font of MicroPython.
+"""
+
+import os
+
+MONO_VLSB = 0
+MVLSB = MONO_VLSB
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Upload_these_to_device', 'ASC16')
+font = None
+
+
+def load_font():
+    # 8x8 glyphs: every pair of rows of the 8x16 font is merged into one row
+    global font
+    if font is None:
+        with open(FONT_FILE, 'rb') as f:
+            data = f.read()
+        font = []
+        for code in range(128):
+            glyph = data[code * 16:(code + 1) * 16]
+            font.append([glyph[2 * row] | glyph[2 * row + 1] for row in range(8)])
+    return font
+
+
+def check_int(*values):
+    for value in values:
+        if not isinstance(value, int):
+            raise TypeError(f"can't convert {type(value).__name__} to int")
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        check_int(width, height, format)
+        self.buf = memoryview(buffer).cast('B')
+        if self.buf.readonly:
+            raise TypeError('object with buffer protocol required')
+        self.fb_width = width
+        self.fb_height = height
+        self.format = format
+        self.stride = width if stride is None else stride
+        if format in (MONO_HLSB, MONO_HMSB):
+            self.stride = (self.stride + 7) & ~7
+        if format not in (MONO_VLSB, MONO_HLSB, MONO_HMSB, GS8):
+            raise ValueError('invalid format')
+
+    # pixel access of the formats
+    def setpixel(self, x, y, c):
+        if self.format == MONO_VLSB:
+            index = (y >> 3) * self.stride + x
+            bit = 1 << (y & 7)
+        elif self.format == GS8:
+            self.buf[y * self.stride + x] = c & 0xFF
+            return
+        else:
+            index = (x + y * self.stride) >> 3
+            bit = 0x80 >> (x & 7) if self.format == MONO_HLSB else 1 << (x & 7)
+        if c & 1:
+            self.buf[index] |= bit
+        else:
+            self.buf[index] &= ~bit & 0xFF
+
+    def getpixel(self, x, y):
+        if self.format == MONO_VLSB:
+            return (self.buf[(y >> 3) * self.stride + x] >> (y & 7)) & 1
+        if self.format == GS8:
+            return self.buf[y * self.stride + x]
+        shift = 7 - (x & 7) if self.format == MONO_HLSB else x & 7
+        return (self.buf[(x + y * self.stride) >> 3] >> shift) & 1
+
+    def fill_area(self, x, y, w, h, c):
+        if h < 1 or w < 1 or x + w <= 0 or y + h <= 0 or y >= self.fb_height or x >= self.fb_width:
+            return
+        xend = min(self.fb_width, x + w)
+        yend = min(self.fb_height, y + h)
+        x = max(x, 0)
+        y = max(y, 0)
+        for yy in range(y, yend):
+            for xx in range(x, xend):
+                self.setpixel(xx, yy, c)
+
+    # the FrameBuffer methods
+    def fill(self, c):
+        check_int(c)
+        if self.format in (MONO_VLSB, MONO_HLSB, MONO_HMSB):
+            value = 0xFF if c & 1 else 0
+            self.buf[:] = bytes([value]) * len(self.buf)
+        else:
+            self.fill_area(0, 0, self.fb_width, self.fb_height, c)
+
+    def pixel(self, x, y, c=None):
+        check_int(x, y)
+        if 0 <= x < self.fb_width and 0 <= y < self.fb_height:
+            if c is None:
+                return self.getpixel(x, y)
+            check_int(c)
+            self.setpixel(x, y, c)
+        return None
+
+    def fill_rect(self, x, y, w, h, c):
+        check_int(x, y, w, h, c)
+        self.fill_area(x, y, w, h, c)
+
+    def hline(self, x, y, w, c):
+        check_int(x, y, w, c)
+        self.fill_area(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        check_int(x, y, h, c)
+        self.fill_area(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        check_int(x, y, w, h, c)
+        if f:
+            self.fill_area(x, y, w, h, c)
+        else:
+            self.fill_area(x, y, w, 1, c)
+            self.fill_area(x, y + h - 1, w, 1, c)
+            self.fill_area(x, y, 1, h, c)
+            self.fill_area(x + w - 1, y, 1, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        check_int(x1, y1, x2, y2, c)
+        dx = x2 - x1
+        if dx > 0:
+            sx = 1
+        else:
+            dx = -dx
+            sx = -1
+        dy = y2 - y1
+        if dy > 0:
+            sy = 1
+        else:
+            dy = -dy
+            sy = -1
+        steep = dy > dx
+        if steep:
+            (x1, y1) = (y1, x1)
+            (dx, dy) = (dy, dx)
+            (sx, sy) = (sy, sx)
+        e = 2 * dy - dx
+        for i in range(dx):
+            if steep:
+                if 0 <= y1 < self.fb_width and 0 <= x1 < self.fb_height:
+                    self.setpixel(y1, x1, c)
+            elif 0 <= x1 < self.fb_width and 0 <= y1 < self.fb_height:
+                self.setpixel(x1, y1, c)
+            while e >= 0:
+                y1 += sy
+                e -= 2 * dx
+            x1 += sx
+            e += 2 * dy
+        if 0 <= x2 < self.fb_width and 0 <= y2 < self.fb_height:
+            self.setpixel(x2, y2, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        check_int(x, y, key)
+        if (x >= self.fb_width or y >= self.fb_height or -x >= fbuf.fb_width or -y >= fbuf.fb_height):
+            return
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = max(0, -x)
+        y1 = max(0, -y)
+        x0end = min(self.fb_width, x + fbuf.fb_width)
+        y0end = min(self.fb_height, y + fbuf.fb_height)
+        for cy in range(y0, y0end):
+            cx1 = x1
+            for cx0 in range(x0, x0end):
+                col = fbuf.getpixel(cx1, y1)
+                if palette is not None:
+                    col = palette.getpixel(col, 0)
+                if col != key:
+                    self.setpixel(cx0, cy, col)
+                cx1 += 1
+            y1 += 1
+
+    def scroll(self, xstep, ystep):
+        check_int(xstep, ystep)
+        if xstep < 0:
+            (sx, xend, dx) = (0, self.fb_width + xstep, 1)
+        else:
+            (sx, xend, dx) = (self.fb_width - 1, xstep - 1, -1)
+        if ystep < 0:
+            (y, yend, dy) = (0, self.fb_height + ystep, 1)
+        else:
+            (y, yend, dy) = (self.fb_height - 1, ystep - 1, -1)
+        while y != yend:
+            x = sx
+            while x != xend:
+                self.setpixel(x, y, self.getpixel(x - xstep, y - ystep))
+                x += dx
+            y += dy
+
+    def text(self, s, x, y, c=1):
+        check_int(x, y, c)
+        glyphs = load_font()
+        for char in str(s):
+            code = ord(char)
+            if code < 32 or code > 127:
+                code = 127
+            for row, bits in enumerate(glyphs[code]):
+                for col in range(8):
+                    if bits & (0x80 >> col):
+                        xx = x + col
+                        yy = y + row
+                        if 0 <= xx < self.fb_width and 0 <= yy < self.fb_height:
+                            self.setpixel(xx, yy, c)
+            x += 8
+
+
+def FrameBuffer1(buffer, width, height, stride=None):
+    return FrameBuffer(buffer, width, height, MONO_VLSB, stride)
@@ -0,0 +1,257 @@
+"""
+Stand-in for the machine module: Pin, PWM, Timer, I2C and SPI.
+
+Pin levels are driven from the host with set_level(), which also calls the Pin.irq handlers.
+Timers run on the virtual clock. I2C writes go to the devices attached with attach_i2c().
+PWM outputs keep a log of (time in us, pin, frequency, duty) that tests can check.
+"""
+
+from simulator.clock import clock
+
+# pin id -> level driven from outside, None when nothing drives the pin
+driven = {}
+# pin id -> list of Pin objects with an irq handler
+irq_pins = {}
+# i2c address -> device with a write(data) method
+i2c_devices = {}
+# (time_us, pin, freq, duty) for every change of a PWM output
+pwm_log = []
+
+
+def reset_state():
+    driven.clear()
+    irq_pins.clear()
+    i2c_devices.clear()
+    del pwm_log[:]
+    Pin.outputs.clear()
+    Pin.pulls.clear()
+
+
+def attach_i2c(addr, device):
+    i2c_devices[addr] = device
+
+
+def set_level(id, level):
+    # drives an input pin from outside, like pressing a button
+    old = Pin(id).value()
+    driven[id] = 1 if level else 0
+    if old == driven[id]:
+        return
+    edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+    for pin in list(irq_pins.get(id, [])):
+        if pin.irq_trigger & edge and pin.irq_handler is not None:
+            pin.irq_handler(pin)
+
+
+def release(id):
+    driven.pop(id, None)
+
+
+def pin_id(pin):
+    return pin.id if isinstance(pin, Pin) else pin
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    # level of output pins, shared by all Pin objects of the same id
+    outputs = {}
+    pulls = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.irq_handler = None
+        self.irq_trigger = 0
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            Pin.pulls[self.id] = pull
+        if value is not None:
+            Pin.outputs[self.id] = 1 if value else 0
+
+    def value(self, value=None):
+        if value is not None:
+            Pin.outputs[self.id] = 1 if value else 0
+            return None
+        if self.id in driven:
+            return driven[self.id]
+        if self.id in Pin.outputs:
+            return Pin.outputs[self.id]
+        return 1 if Pin.pulls.get(self.id) == Pin.PULL_UP else 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        pins = irq_pins.setdefault(self.id, [])
+        if self in pins:
+            pins.remove(self)
+        self.irq_handler = handler
+        self.irq_trigger = trigger
+        if handler is not None:
+            pins.append(self)
+        return self
+
+    def __repr__(self):
+        return f'Pin({self.id})'
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty=None, duty_u16=None):
+        self.pin = pin_id(pin)
+        self.frequency = 5000
+        self.duty_value = 0
+        if freq is not None:
+            self.freq(freq)
+        if duty is not None:
+            self.duty(duty)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def log(self):
+        pwm_log.append((clock.now_us, self.pin, self.frequency, self.duty_value))
+
+    def freq(self, value=None):
+        if value is None:
+            return self.frequency
+        self.frequency = int(value)
+        self.log()
+
+    def duty(self, value=None):
+        # 10 bit duty like the ESP32 port
+        if value is None:
+            return self.duty_value >> 6
+        self.duty_value = int(value) << 6
+        self.log()
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.duty_value
+        self.duty_value = int(value)
+        self.log()
+
+    def deinit(self):
+        self.duty_value = 0
+        self.log()
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self.event = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        self.mode = mode
+        self.period_us = max(1, int(period * 1000))
+        self.callback = callback
+        self.event = clock.call_later(self.period_us, self.fire)
+
+    def fire(self):
+        if self.mode == Timer.PERIODIC:
+            self.event = clock.call_later(self.period_us, self.fire)
+        else:
+            self.event = None
+        if self.callback is not None:
+            self.callback(self)
+
+    def deinit(self):
+        clock.cancel(self.event)
+        self.event = None
+
+
+class I2C:
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000, timeout=50000):
+        self.id = id
+        self.freq = freq
+        self.bytes_written = 0
+        self.transactions = 0
+
+    def device(self, addr):
+        if addr not in i2c_devices:
+            raise OSError(19, 'ENODEV')
+        return i2c_devices[addr]
+
+    def scan(self):
+        return sorted(i2c_devices)
+
+    def writeto(self, addr, buf, stop=True):
+        self.device(addr).write(bytes(buf))
+        self.bytes_written += len(buf)
+        self.transactions += 1
+        return 1
+
+    def writevto(self, addr, vector, stop=True):
+        data = b''.join(bytes(buf) for buf in vector)
+        self.device(addr).write(data)
+        self.bytes_written += len(data)
+        self.transactions += 1
+        return 1
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self.device(addr)
+        return bytes(nbytes)
+
+
+SoftI2C = I2C
+
+
+class SPI:
+    def __init__(self, id=-1, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.id = id
+        self.written = []
+
+    def init(self, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        pass
+
+    def write(self, buf):
+        self.written.append(bytes(buf))
+
+    def deinit(self):
+        pass
+
+
+SoftSPI = SPI
+
+
+def disable_irq():
+    # the irq handlers only run from clock events, never in the middle of the game code
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def freq(value=None):
+    return 240000000
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def unique_id():
+    return b'\x00sim\x00\x00'
@@ -0,0 +1,30 @@
+"""Stand-in for the micropython module. The code emitters are plain Python on the host."""
+
+
+def const(value):
+    return value
+
+
+def native(function):
+    return function
+
+
+def viper(function):
+    return function
+
+
+def schedule(function, arg):
+    function(arg)
+    return True
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    pass
+
+
+def opt_level(level=None):
+    return 0
@@ -0,0 +1,246 @@
+"""
+Virtual SSD1306 panel attached to the I2C stand-in.
+
+It decodes the bytes the ssd1306 driver writes (control byte, commands and GDDRAM data) and keeps
+the panel state: GDDRAM, address window, display on/off, contrast, inversion and start line.
+frame() returns what the panel shows as rows of 0/1, as a NumPy array when NumPy is installed.
+save_png() writes a frame without any dependency.
+With a clock the hardware scroll is emulated, the panel refreshes at FRAME_HZ.
+"""
+
+import struct
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# number of parameter bytes of the commands that have parameters
+PARAMS = {0x20: 1, 0x21: 2, 0x22: 2, 0x81: 1, 0xA8: 1, 0xD3: 1, 0xDA: 1, 0xD5: 1, 0xD9: 1,
+          0xDB: 1, 0x8D: 1, 0x26: 6, 0x27: 6, 0x29: 5, 0x2A: 5, 0xA3: 2}
+FRAME_HZ = 100
+# frames between two scroll steps for the interval codes of the scroll setup commands
+INTERVALS = (5, 64, 128, 256, 3, 4, 25, 2)
+
+
+class VirtualSSD1306:
+    def __init__(self, width=128, height=64, clock=None):
+        self.clock = clock
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.ram = bytearray(width * self.pages)
+        self.on = False
+        self.contrast = 0x7F
+        self.inverted = False
+        self.entire_on = False
+        self.start_line = 0
+        self.scrolling = False
+        self.scroll = None  # the last scroll setup command with its parameters
+        self.scroll_start_us = 0
+        self.scroll_area = (0, height)
+        self.addressing = 0x02  # page addressing after reset
+        self.col_start = 0
+        self.col_end = width - 1
+        self.page_start = 0
+        self.page_end = self.pages - 1
+        self.col = 0
+        self.page = 0
+        self.command = None  # command waiting for its parameters
+        self.params = []
+        self.commands = 0
+        self.data_bytes = 0
+        self.writes = 0
+
+    # I2C device
+    def write(self, data):
+        self.writes += 1
+        i = 0
+        while i < len(data):
+            control = data[i]
+            i += 1
+            if control & 0x40:
+                # data, the rest of the transfer goes to GDDRAM
+                self.write_ram(data[i:])
+                return
+            if control & 0x80:
+                # Co=1: one command byte then another control byte
+                if i < len(data):
+                    self.write_command(data[i])
+                    i += 1
+            else:
+                # Co=0: the rest of the transfer is commands
+                for byte in data[i:]:
+                    self.write_command(byte)
+                return
+
+    def write_command(self, byte):
+        if self.command is not None:
+            self.params.append(byte)
+            if len(self.params) == PARAMS[self.command]:
+                self.execute(self.command, self.params)
+                self.command = None
+            return
+        self.commands += 1
+        if byte in PARAMS:
+            self.command = byte
+            self.params = []
+        else:
+            self.execute(byte, ())
+
+    def execute(self, cmd, params):
+        if cmd == 0x20:
+            self.addressing = params[0] & 0x03
+        elif cmd == 0x21:
+            self.col_start = params[0] % self.width
+            self.col_end = params[1] % self.width
+            self.col = self.col_start
+        elif cmd == 0x22:
+            self.page_start = params[0] % self.pages
+            self.page_end = params[1] % self.pages
+            self.page = self.page_start
+        elif cmd == 0x81:
+            self.contrast = params[0]
+        elif cmd in (0xAE, 0xAF):
+            self.on = cmd == 0xAF
+        elif cmd in (0xA6, 0xA7):
+            self.inverted = cmd == 0xA7
+        elif cmd in (0xA4, 0xA5):
+            self.entire_on = cmd == 0xA5
+        elif 0x40 <= cmd <= 0x7F:
+            self.start_line = cmd & 0x3F
+        elif cmd in (0x26, 0x27, 0x29, 0x2A):
+            self.scroll = (cmd, tuple(params))
+        elif cmd == 0xA3:
+            self.scroll_area = tuple(params)  # the vertical scroll always moves the whole screen here
+        elif cmd == 0x2E:
+            if self.scrolling:
+                self.apply_scroll()
+            self.scrolling = False
+        elif cmd == 0x2F:
+            self.scrolling = True
+            self.scroll_start_us = self.clock.now_us if self.clock else 0
+        elif 0xB0 <= cmd <= 0xB7:
+            self.page = cmd & 0x07
+        elif cmd <= 0x0F:
+            self.col = (self.col & 0xF0) | cmd
+        elif cmd <= 0x1F:
+            self.col = (self.col & 0x0F) | ((cmd & 0x0F) << 4)
+        # the other commands only set up the panel hardware
+
+    def write_ram(self, data):
+        self.data_bytes += len(data)
+        for byte in data:
+            self.ram[self.page * self.width + self.col] = byte
+            if self.addressing == 0x02:
+                if self.col < self.width - 1:
+                    self.col += 1
+            elif self.addressing == 0x00:
+                # horizontal: wrap to the next page of the window
+                if self.col == self.col_end:
+                    self.col = self.col_start
+                    self.page = self.page_start if self.page == self.page_end else self.page + 1
+                else:
+                    self.col += 1
+            elif self.page == self.page_end:
+                # vertical: wrap to the next column of the window
+                self.page = self.page_start
+                self.col = self.col_start if self.col == self.col_end else self.col + 1
+            else:
+                self.page += 1
+
+    def reset_stats(self):
+        self.commands = 0
+        self.data_bytes = 0
+        self.writes = 0
+
+    # hardware scroll
+    def scroll_steps(self):
+        if not self.scrolling or self.scroll is None or self.clock is None:
+            return 0
+        frames = (self.clock.now_us - self.scroll_start_us) * FRAME_HZ // 1000000
+        return frames // INTERVALS[self.scroll[1][2] & 7]
+
+    def scroll_state(self):
+        # (columns moved right, first page, last page, rows moved up)
+        steps = self.scroll_steps()
+        if steps == 0:
+            return (0, 0, -1, 0)
+        (cmd, params) = self.scroll
+        shift = steps if cmd in (0x26, 0x29) else -steps
+        rows = steps * params[4] if cmd in (0x29, 0x2A) else 0
+        return (shift, params[1], params[3], rows)
+
+    def apply_scroll(self):
+        # the scroll moves the columns in the RAM, stopping leaves them where they are
+        (shift, first, last, rows) = self.scroll_state()
+        for page in range(first, last + 1):
+            row = self.ram[page * self.width:(page + 1) * self.width]
+            for x in range(self.width):
+                self.ram[page * self.width + x] = row[(x - shift) % self.width]
+        self.start_line = (self.start_line + rows) % self.height
+
+    # what the panel shows
+    def ram_pixel(self, x, y):
+        return (self.ram[(y >> 3) * self.width + x] >> (y & 7)) & 1
+
+    def rows(self):
+        # list of rows of 0/1, the driver maps buffer pixel (x, y) to screen pixel (x, y)
+        rows = []
+        (shift, first, last, scrolled) = self.scroll_state()
+        for y in range(self.height):
+            if not self.on:
+                rows.append([0] * self.width)
+                continue
+            if self.entire_on:
+                rows.append([1] * self.width)
+                continue
+            line = (y + self.start_line + scrolled) % self.height
+            invert = 1 if self.inverted else 0
+            moved = shift if first <= line >> 3 <= last else 0
+            rows.append([self.ram_pixel((x - moved) % self.width, line) ^ invert for x in range(self.width)])
+        return rows
+
+    def frame(self):
+        # height x width array of 0/1, a list of lists without NumPy
+        rows = self.rows()
+        if numpy is not None:
+            return numpy.array(rows, dtype=numpy.uint8)
+        return rows
+
+    def brightness(self):
+        # grey level of lit pixels, contrast 0 is still visible on the real panel
+        return 64 + self.contrast * 191 // 255
+
+    def ascii(self, rows=None):
+        rows = self.rows() if rows is None else rows
+        return '\n'.join(''.join('#' if p else '.' for p in row) for row in rows)
+
+    def save_png(self, path, scale=4, rows=None):
+        rows = self.rows() if rows is None else rows
+        save_png(path, rows, scale, self.brightness())
+
+
+def save_png(path, rows, scale=4, level=255):
+    # 8 bit greyscale PNG of rows of 0/1, each pixel scaled to scale x scale
+    height = len(rows)
+    width = len(rows[0]) if height else 0
+    raw = bytearray()
+    for row in rows:
+        line = bytearray([0])  # filter type none
+        for p in row:
+            line += bytes([level if p else 0]) * scale
+        for i in range(scale):
+            raw += line
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack('>IIBBBBB', width * scale, height * scale, 8, 0, 0, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', header))
+        f.write(chunk(b'IDAT', zlib.compress(bytes(raw))))
+        f.write(chunk(b'IEND', b''))
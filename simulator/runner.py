@@ -0,0 +1,181 @@
+"""
+Runs src/game.py on the host with the stand-ins of simulator/device.
+
+    sim = Simulator()
+    sim.press(2000, 400)       # long press 2 s after the start
+    sim.run(10000)             # 10 s of game time, as fast as the host can run it
+    sim.save_frames('frames')  # PNG of every captured frame
+
+The simulator works in a temporary copy of the device files. close(), or the end of a with
+block, goes back to the previous directory and deletes the copy:
+
+    with Simulator() as sim:
+        sim.run(10000)
+
+Simulator(record='session.rec') records the presses for Game.replay, stop_recording() ends the
+recording. Simulator(replay='session.rec') plays a recording made here or on the device.
+
+The game runs its own main loop (Game.run). Time only moves when the loop sleeps, button presses
+and the end of the run are events on the virtual clock.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEVICE = os.path.join(ROOT, 'simulator', 'device')
+LIBRARIES = os.path.join(ROOT, 'Upload_these_to_device')
+SOURCE = os.path.join(ROOT, 'src')
+IMAGES = os.path.join(SOURCE, 'images')
+
+BUTTON_PIN = 4
+BUZZER_PIN = 23
+OLED_ADDR = 0x3C
+
+
+def setup_path():
+    # the stand-ins come first so that they shadow nothing else, then the device libraries
+    for path in (SOURCE, LIBRARIES, DEVICE, ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def make_filesystem(directory=None):
+    # the game opens its files relative to the current directory like on the device
+    directory = directory or tempfile.mkdtemp(prefix='catch_the_stars_')
+    for source in (LIBRARIES, IMAGES):
+        for name in os.listdir(source):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and not name.endswith('.py'):
+                shutil.copy(path, os.path.join(directory, name))
+    return directory
+
+
+def placeholder_pbm(path, width=128, height=64):
+    with open(path, 'wb') as f:
+        f.write(b'P4\n%d %d\n' % (width, height) + bytes(width // 8 * height))
+
+
+class Simulator:
+    def __init__(self, seed=0, quiet=True, capture=True, directory=None, pipelined=False, record=None, replay=None):
+        setup_path()
+        from simulator.clock import clock, TimeModule
+        import machine
+        import ssd1306
+        from simulator.panel import VirtualSSD1306
+
+        self.clock = clock
+        self.machine = machine
+        clock.reset()
+        machine.reset_state()
+        random.seed(seed)
+
+        self.cwd = os.getcwd()  # relative paths given to the simulator are relative to this
+        self.temporary = directory is None  # close() deletes the file system it made
+        self.directory = make_filesystem(directory)
+        os.chdir(self.directory)
+        import game
+        self.module = game
+        if not os.path.exists(game.CatchTheStarsGame.SPLASH):
+            placeholder_pbm(game.CatchTheStarsGame.SPLASH)
+
+        # time is the only module of the game that is replaced after the import
+        game.time = TimeModule(clock)
+        game.sleep = clock.sleep
+        if quiet:
+            game.print = lambda *args, **kwargs: None
+        elif hasattr(game, 'print'):
+            del game.print
+
+        self.panel = VirtualSSD1306(clock=clock)
+        machine.attach_i2c(OLED_ADDR, self.panel)
+        self.i2c = machine.I2C(-1, scl=machine.Pin(22), sda=machine.Pin(21))
+        self.oled = ssd1306.SSD1306_I2C(128, 64, self.i2c)
+        self.oled.set_partial(True)
+        self.game = game.CatchTheStarsGame(self.oled, BUTTON_PIN, BUZZER_PIN, pipelined)
+        game.game = self.game
+        if record is not None:
+            self.game.record(os.path.join(self.cwd, record))
+        elif replay is not None:
+            self.game.replay(os.path.join(self.cwd, replay))
+
+        self.capture = capture
+        self.frames = []  # (time in us, frame) after every draw
+        self.draws = 0
+        self.wrap_draw()
+        self.started = False
+
+    def close(self):
+        # stops the pipeline thread, goes back to the directory the simulator was made in
+        # and deletes the temporary file system
+        pipeline = self.game.pipeline
+        if pipeline is not None and not pipeline.stopping:
+            pipeline.stop()
+        os.chdir(self.cwd)
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def wrap_draw(self):
+        draw = self.game.draw
+
+        def captured_draw():
+            draw()
+            self.draws += 1
+            if self.capture:
+                if self.game.pipeline is not None:
+                    self.game.pipeline.flush()  # the worker thread is still sending the frame
+                self.frames.append((self.clock.now_us, self.panel.frame()))
+        self.game.draw = captured_draw
+
+    # scripted input, times in ms from now
+    def press(self, at_ms, duration_ms=50):
+        self.clock.call_later(at_ms * 1000, lambda: self.machine.set_level(BUTTON_PIN, 0))
+        self.clock.call_later((at_ms + duration_ms) * 1000, lambda: self.machine.set_level(BUTTON_PIN, 1))
+
+    def script(self, presses):
+        # presses: list of (ms from now, duration in ms)
+        for (at_ms, duration_ms) in presses:
+            self.press(at_ms, duration_ms)
+
+    def run(self, duration_ms):
+        # runs the main loop of the game for duration_ms of game time
+        def stop():
+            self.game.running = False
+        self.clock.call_later(duration_ms * 1000, stop)
+        if not self.started:
+            self.game.show_splash()
+            self.started = True
+        self.game.run()
+
+    def stop_recording(self):
+        self.game.end_session()
+
+    def time_ms(self):
+        return self.clock.now_us // 1000
+
+    def screen(self):
+        # the panel as text, '#' for a lit pixel
+        return self.panel.ascii()
+
+    def save_frames(self, directory, scale=4, every=1):
+        from simulator.panel import save_png
+        directory = os.path.join(self.cwd, directory)
+        os.makedirs(directory, exist_ok=True)
+        names = []
+        for (number, (time_us, frame)) in enumerate(self.frames):
+            if number % every:
+                continue
+            rows = frame.tolist() if hasattr(frame, 'tolist') else frame
+            name = os.path.join(directory, f'frame_{number:05d}_{time_us // 1000:07d}ms.png')
+            save_png(name, rows, scale)
+            names.append(name)
+        return names
@@ -1,73 +1,430 @@
-from machine import Pin, PWM, Timer, I2C
+from machine import Pin, PWM, Timer, I2C, disable_irq, enable_irq
 import ssd1306  # Make sure to install the ssd1306 library for your OLED display
 import time, math
 from buzzer_music import music
+from songs import compile_song
 from time import sleep
 from font import Font
 import framebuf
 import random
+import struct
+import gc
+import json
+import os
+import binascii
+from array import array
 
 
 class Button:
+    # The pin interrupt times the presses, the main loop only takes the finished presses out of
+    # a ring buffer. The interrupt handler doesn't allocate: it writes ints into preallocated
+    # arrays and only it moves head, only the main loop moves tail, so no lock is needed.
+    # The one exception is a release the debounce swallowed: the main loop queues it with the
+    # interrupts disabled, so the handler can't run in the middle.
     NOT_PRESSED = 0
     SHORT_PRESS = 1
     LONG_PRESS = 2
 
     LONG_PRESS_THRESHOLD = 250  # in milliseconds
+    DEBOUNCE_MS = 20  # edges closer than this to the last one are contact bounce
+    QUEUE_SIZE = 8  # a power of 2, presses that don't fit are dropped
 
     def __init__(self, pin):
         self.button_pin = Pin(pin, Pin.IN, Pin.PULL_UP)
-        self.last_press_time = 0
-        self.last_state = False
-        self.last_release_time = 0
+        self.pressed = False
+        self.press_time = 0
+        self.edge_time = time.ticks_add(time.ticks_ms(), -self.DEBOUNCE_MS)  # last edge that counted
+        self.last_edge_time = self.edge_time  # last edge, bounce or not
+        self.kinds = bytearray(self.QUEUE_SIZE)
+        self.times = array('i', [0] * self.QUEUE_SIZE)  # ticks_ms of the releases
+        self.durations = array('i', [0] * self.QUEUE_SIZE)
+        self.head = 0
+        self.tail = 0
         self.new_state = self.NOT_PRESSED
+        self.event_time = 0  # ticks_ms of the release of the press in new_state
+        self.event_duration = 0
+        self.button_pin.irq(handler=self.edge, trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING)
     
-    def update_state(self):        
-        button_state = not self.button_pin.value()
-        if button_state != self.last_state:
-            print(f'button {button_state}')
-        self.last_state = button_state
-        
+    def edge(self, pin):
+        # interrupt handler
+        now = time.ticks_ms()
+        self.last_edge_time = now
+        if time.ticks_diff(now, self.edge_time) < self.DEBOUNCE_MS:
+            return
+        self.edge_time = now
+        if not pin.value():
+            if not self.pressed:
+                self.pressed = True
+                self.press_time = now
+        elif self.pressed:
+            self.released(now)
+    
+    def released(self, now):
+        self.pressed = False
+        head = self.head
+        if (head + 1) % self.QUEUE_SIZE == self.tail:
+            return  # full
+        duration = time.ticks_diff(now, self.press_time)
+        self.kinds[head] = self.LONG_PRESS if duration > self.LONG_PRESS_THRESHOLD else self.SHORT_PRESS
+        self.times[head] = now
+        self.durations[head] = duration
+        self.head = (head + 1) % self.QUEUE_SIZE
+    
+    def update_state(self):
+        # called once per tick: the next press, if there is one, is the state of this tick
+        if self.pressed and self.button_pin.value():
+            # The release edge came within the debounce time of the press and was ignored.
+            # The button has been released at its last edge.
+            state = disable_irq()
+            if self.pressed and time.ticks_diff(time.ticks_ms(), self.last_edge_time) >= self.DEBOUNCE_MS:
+                self.released(self.last_edge_time)
+            enable_irq(state)
         self.new_state = self.NOT_PRESSED
-        
-        if button_state:
-            if self.last_press_time == 0:
-                self.last_press_time = time.ticks_ms()
-            
-        else:
-            if (self.last_press_time != 0):
-                press_duration = time.ticks_ms() - self.last_press_time
-                self.last_press_time = 0
-                self.new_state = self.LONG_PRESS if press_duration > self.LONG_PRESS_THRESHOLD else self.SHORT_PRESS
+        tail = self.tail
+        if tail != self.head:
+            self.new_state = self.kinds[tail]
+            self.event_time = self.times[tail]
+            self.event_duration = self.durations[tail]
+            self.tail = (tail + 1) % self.QUEUE_SIZE
+
+    def is_pressed(self):
+        return self.new_state
+    
+class InputRecorder:
+    # Takes the place of the Button in a recorded session and writes every press with the number
+    # of its tick to a file. The file starts with HEADER (magic and the seed of the session)
+    # followed by RECORD (tick, state) for every press. close() writes a NOT_PRESSED record
+    # with the last finished tick. Presses are rare, so each one is written right away.
+    MAGIC = b"REC1"
+    HEADER = "<4sI"
+    RECORD = "<IB"
+    
+    def __init__(self, game, button, file, seed):
+        self.game = game
+        self.button = button
+        self.file = open(file, "wb")
+        self.file.write(struct.pack(self.HEADER, self.MAGIC, seed))
+        self.file.flush()
+    
+    def update_state(self):
+        self.button.update_state()
+        state = self.button.new_state
+        if state != Button.NOT_PRESSED and self.file is not None:
+            self.file.write(struct.pack(self.RECORD, self.game.tick_count, state))
+            self.file.flush()
+    
+    def is_pressed(self):
+        return self.button.new_state
+    
+    def close(self):
+        if self.file is not None:
+            self.file.write(struct.pack(self.RECORD, max(0, self.game.tick_count - 1), Button.NOT_PRESSED))
+            self.file.close()
+            self.file = None
 
+class InputReplay:
+    # Takes the place of the Button and gives the presses of a recorded session at their ticks.
+    # The game stops at the last tick of the recording.
+    def __init__(self, game, file):
+        self.game = game
+        with open(file, "rb") as f:
+            data = f.read()
+        (magic, self.seed) = struct.unpack_from(InputRecorder.HEADER, data)
+        if magic != InputRecorder.MAGIC:
+            raise ValueError(f"{file} is not an input recording")
+        header_size = struct.calcsize(InputRecorder.HEADER)
+        record_size = struct.calcsize(InputRecorder.RECORD)
+        count = (len(data) - header_size) // record_size
+        self.ticks = array('I', [0] * count)
+        self.states = bytearray(count)
+        for i in range(count):
+            (self.ticks[i], self.states[i]) = struct.unpack_from(InputRecorder.RECORD, data, header_size + i * record_size)
+        self.index = 0
+        self.new_state = Button.NOT_PRESSED
+    
+    def update_state(self):
+        self.new_state = Button.NOT_PRESSED
+        tick = self.game.tick_count
+        if self.index < len(self.ticks) and self.ticks[self.index] == tick and self.states[self.index] != Button.NOT_PRESSED:
+            self.new_state = self.states[self.index]
+            self.index = self.index + 1
+        if self.index < len(self.ticks) and self.ticks[self.index] == tick:
+            self.index = self.index + 1
+            self.game.running = False  # the last tick of the recording is still played and drawn
+    
     def is_pressed(self):
         return self.new_state
     
+    def close(self):
+        pass
+
+class SoftTimer:
+    def __init__(self, callback, period, mode):
+        self.callback = callback
+        self.period = period  # in wheel ticks
+        self.mode = mode
+        self.rounds = 0
+        self.cancelled = False
+        self.slot = -1  # the wheel slot it waits in
+
+class TimerWheel:
+    # Any number of one shot and periodic timers multiplexed on a single hardware timer.
+    # The hardware timer only counts ticks, run() is called from the main loop and calls
+    # the callbacks there, so they never run in the middle of a game tick or draw.
+    RESOLUTION = 10  # in milliseconds
+    SLOTS = 32
+    TICKS_MASK = 0x3FFFFFFF  # keep the tick counters small ints so the interrupt never allocates
+    
+    def __init__(self, timer):
+        self.slots = [[] for i in range(self.SLOTS)]
+        self.spare = []
+        self.irq_ticks = 0
+        self.ticks = 0
+        self.elapsed_us = 0
+        self.timer = timer
+        timer.init(period=self.RESOLUTION, mode=Timer.PERIODIC, callback=self.count)
+    
+    def count(self, timer):
+        self.irq_ticks = (self.irq_ticks + 1) & self.TICKS_MASK
+    
+    def use_game_time(self):
+        # from now on the wheel turns with advance() from the game ticks instead of the hardware timer
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+    
+    def advance(self, us):
+        self.elapsed_us = self.elapsed_us + us
+        while self.elapsed_us >= self.RESOLUTION * 1000:
+            self.elapsed_us = self.elapsed_us - self.RESOLUTION * 1000
+            self.irq_ticks = (self.irq_ticks + 1) & self.TICKS_MASK
+    
+    def one_shot(self, duration, callback):
+        return self.schedule(SoftTimer(callback, self.to_ticks(duration), Timer.ONE_SHOT))
+    
+    def periodic(self, period, callback):
+        return self.schedule(SoftTimer(callback, self.to_ticks(period), Timer.PERIODIC))
+    
+    def cancel(self, soft_timer):
+        # the timer is dropped the next time its slot comes up
+        if soft_timer is not None:
+            soft_timer.cancelled = True
+    
+    def restart(self, soft_timer, duration):
+        # schedules a timer again instead of allocating a new one, also when it's waiting or cancelled
+        if soft_timer.slot >= 0:
+            self.slots[soft_timer.slot].remove(soft_timer)
+        soft_timer.cancelled = False
+        soft_timer.period = self.to_ticks(duration)
+        return self.schedule(soft_timer)
+    
+    def to_ticks(self, duration):
+        return max(1, (duration + self.RESOLUTION - 1) // self.RESOLUTION)
+    
+    def schedule(self, soft_timer):
+        # the timer fires after rounds full turns of the wheel once its slot comes up
+        soft_timer.rounds = (soft_timer.period - 1) // self.SLOTS
+        soft_timer.slot = (self.ticks + soft_timer.period) % self.SLOTS
+        self.slots[soft_timer.slot].append(soft_timer)
+        return soft_timer
+    
+    def run(self):
+        while self.ticks != self.irq_ticks:
+            self.ticks = (self.ticks + 1) & self.TICKS_MASK
+            # swap in an empty list so callbacks can add timers to this slot
+            index = self.ticks % self.SLOTS
+            slot = self.slots[index]
+            self.slots[index] = self.spare
+            for soft_timer in slot:
+                soft_timer.slot = -1
+            for soft_timer in slot:
+                if soft_timer.cancelled or soft_timer.slot >= 0:
+                    continue  # a callback restarted it, it waits in another slot now
+                if soft_timer.rounds > 0:
+                    soft_timer.rounds = soft_timer.rounds - 1
+                    soft_timer.slot = index
+                    self.slots[index].append(soft_timer)
+                    continue
+                if soft_timer.mode == Timer.PERIODIC:
+                    self.schedule(soft_timer)
+                soft_timer.callback(soft_timer)
+            del slot[:]
+            self.spare = slot
+    
 class Buzzer:
-    def __init__(self, pin):
+    def __init__(self, pin, timers):
         self.buzzer_pin = PWM(Pin(pin))
         self.buzzer_pin.duty(0)
         self.mute = False
+        self.timers = timers
+        # every buzz restarts the same timer, the bounces of the ball don't allocate
+        self.stop_timer = SoftTimer(self.stop, 1, Timer.ONE_SHOT)
         
     def buzz(self, frequency, duration):
         if not self.mute:
             self.buzzer_pin.freq(frequency)
             self.buzzer_pin.duty(50)
-            Utils.one_shot_timer(duration, self.stop)
+            # a new buzz replaces the one that is playing
+            self.timers.restart(self.stop_timer, duration)
         
     def stop(self, timer = None):
+        self.timers.cancel(self.stop_timer)
         self.buzzer_pin.duty(0)
         print("buzz stop")
 
     def toggle_mute(self):
         self.mute = not self.mute
 
+class Scene:
+    # Holds the assets of the game. Changes are queued and applied between the tick and draw
+    # phases, so assets can add and remove assets (also themselves) while the game iterates.
+    # Assets are drawn layer by layer and every asset remembers its place in the lists so it
+    # can be removed in O(1). Assets that don't tick or don't draw are left out of that list.
+    LAYER_BACKGROUND = 0
+    LAYER_WORLD = 1
+    LAYER_UI = 2
+    LAYER_OVERLAY = 3
+    NUM_LAYERS = 4
+    
+    ADD = 0
+    REMOVE = 1
+    CLEAR = 2
+    
+    def __init__(self):
+        self.ticking = []
+        self.layers = [[] for i in range(self.NUM_LAYERS)]
+        self.removed = [0] * (self.NUM_LAYERS + 1)  # removed entries per layer, last one for ticking
+        self.pending_ops = []
+        self.pending_assets = []
+    
+    def add(self, asset):
+        self.pending_ops.append(self.ADD)
+        self.pending_assets.append(asset)
+    
+    def remove(self, asset):
+        self.pending_ops.append(self.REMOVE)
+        self.pending_assets.append(asset)
+    
+    def clear(self):
+        self.pending_ops.append(self.CLEAR)
+        self.pending_assets.append(None)
+    
+    def apply(self):
+        if not self.pending_ops:
+            return
+        for i in range(len(self.pending_ops)):
+            op = self.pending_ops[i]
+            if op == self.ADD:
+                self.insert(self.pending_assets[i])
+            elif op == self.REMOVE:
+                self.delete(self.pending_assets[i])
+            else:
+                self.delete_all()
+        del self.pending_ops[:]
+        del self.pending_assets[:]
+    
+    def insert(self, asset):
+        if asset.scene_draw_index >= 0 or asset.scene_tick_index >= 0:
+            return  # already in the scene
+        if asset.button_handler is not None or type(asset).tick is not DisplayAsset.tick:
+            asset.scene_tick_index = len(self.ticking)
+            self.ticking.append(asset)
+        if type(asset).draw is not DisplayAsset.draw:
+            asset.scene_draw_index = len(self.layers[asset.LAYER])
+            self.layers[asset.LAYER].append(asset)
+    
+    def delete(self, asset):
+        if asset.scene_tick_index < 0 and asset.scene_draw_index < 0:
+            return  # not in the scene
+        if asset.scene_tick_index >= 0:
+            self.ticking[asset.scene_tick_index] = None
+            asset.scene_tick_index = -1
+            self.compact(self.ticking, self.NUM_LAYERS)
+        if asset.scene_draw_index >= 0:
+            self.layers[asset.LAYER][asset.scene_draw_index] = None
+            asset.scene_draw_index = -1
+            self.compact(self.layers[asset.LAYER], asset.LAYER)
+        asset.removed()
+    
+    def compact(self, assets, index):
+        # removed entries are left as None until they are half of the list
+        self.removed[index] = self.removed[index] + 1
+        if self.removed[index] * 2 < len(assets):
+            return
+        position = 0
+        for asset in assets:
+            if asset is not None:
+                if index == self.NUM_LAYERS:
+                    asset.scene_tick_index = position
+                else:
+                    asset.scene_draw_index = position
+                assets[position] = asset
+                position = position + 1
+        del assets[position:]
+        self.removed[index] = 0
+    
+    def delete_all(self):
+        for asset in self.ticking:
+            if asset is not None:
+                asset.scene_tick_index = -1
+                if asset.scene_draw_index < 0:
+                    asset.removed()
+        del self.ticking[:]
+        for layer in self.layers:
+            for asset in layer:
+                if asset is not None:
+                    asset.scene_draw_index = -1
+                    asset.removed()
+            del layer[:]
+        for i in range(len(self.removed)):
+            self.removed[i] = 0
+    
+class Pool:
+    # Preallocated assets that are reset and reused instead of allocated during the game.
+    # An asset goes back to its pool when it is removed from the scene.
+    def __init__(self, factory, capacity):
+        self.factory = factory
+        self.free = [factory() for i in range(capacity)]
+    
+    def acquire(self):
+        if self.free:
+            asset = self.free.pop()
+        else:
+            print("pool is empty")
+            asset = self.factory()
+        asset.pool = self
+        return asset
+    
+    def release(self, asset):
+        asset.pool = None
+        self.free.append(asset)
+    
+class SpriteCache:
+    # Fixed vector shapes drawn once into small FrameBuffers. They are blitted with key 0
+    # so only the lit pixels are drawn, like with the drawing functions.
+    def __init__(self):
+        self.sprites = {}
+    
+    def get(self, name, width, height, paint):
+        # paint(fb) draws the shape the first time the sprite is asked for
+        if name not in self.sprites:
+            fb = framebuf.FrameBuffer(bytearray(width * ((height + 7) // 8)), width, height, framebuf.MONO_VLSB)
+            paint(fb)
+            self.sprites[name] = fb
+        return self.sprites[name]
+
 class DisplayAsset:
+    LAYER = Scene.LAYER_WORLD
+    
     def __init__(self, game, x = 0, y = 0, button_handler = None):
         self.x = x
         self.y = y
         self.game = game
         self.button_handler = button_handler
+        # position in the scene lists, -1 when the asset isn't in the scene
+        self.scene_tick_index = -1
+        self.scene_draw_index = -1
+        self.pool = None
 
     def tick(self):
         if self.button_handler is not None:
@@ -82,20 +439,73 @@ class DisplayAsset:
     def destroy(self):
         # Cleanup
         pass
+    
+    def removed(self):
+        # Called when the asset is taken out of the scene
+        if self.pool is not None:
+            self.pool.release(self)
+
+class Fixed():
+    # Fixed point numbers for the physics (Game.FIXED_POINT): a value v is the int
+    # round(v * ONE), so the integer math of a tick never allocates, floats do on the device.
+    # ONE is decimal rather than a power of 2 because GRAVITY 0.2, energy_loss 0.6 and the
+    # brightness step 0.3 are exact in it. In Q12 GRAVITY would be 819/4096, an error that
+    # grows with the square of the ticks and moved some bounces by up to 10 pixels.
+    # Precision: steps of 0.0001 pixel. Only the speeds of a shot and of a bounce are rounded,
+    # by at most 0.00005 pixel per tick, so a position drifts by 0.01 pixel in the 216 ticks
+    # of the longest shot. The float physics rounds too: when a float lands within its
+    # rounding error of a wall the two can still take different bounces.
+    # Range: small ints have 31 bits on the ESP32, so values must stay within 2**30 / ONE
+    # (107374) pixels and a speed times energy_loss within 2**30, that is speeds below 17
+    # pixels per tick. A shot starts at 7 at most, falling from the top of the screen adds 5.
+    ONE = 10000
+    HALF = ONE // 2
+    
+    def from_float(value):
+        return int(math.floor(value * Fixed.ONE + 0.5))
+    
+    def to_float(value):
+        return value / Fixed.ONE
 
 class Ball(DisplayAsset):
     def __init__(self, game, x, y):
         super().__init__(game, x, y)
+        self.energy_loss = 0.6
+        self.RADIUS = 3
+        self.sprite = game.sprites.get("ball", 7, 7, Ball.paint)
+        self.fixed_point = game.FIXED_POINT
+        # the fixed point constants and walls
+        self.gravity_fp = Fixed.from_float(game.GRAVITY)
+        self.energy_loss_fp = Fixed.from_float(self.energy_loss)
+        self.floor_fp = Fixed.from_float(self.close_to(game.display.height))
+        self.right_fp = Fixed.from_float(self.close_to(game.display.width))
+        self.left_fp = Fixed.from_float(self.close_to(0))
+        self.reset(x, y)
+    
+    def reset(self, x, y):
+        self.x = x
+        self.y = y
         self.y_speed = 0  # Initial speed along the y-axis
         self.x_speed = 0
-        self.energy_loss = 0.6
         self.moving = False
-        self.RADIUS = 3
+        # position before the last tick, collisions are checked along the whole move
+        self.prev_x = x
+        self.prev_y = y
+        # with fixed point the position and speed are Fixed, x and y are the pixels
+        self.x_fp = Fixed.from_float(x)
+        self.y_fp = Fixed.from_float(y)
+        self.x_speed_fp = 0
+        self.y_speed_fp = 0
     
     def close_to(self, val):
         return math.fabs(val - self.RADIUS)
     
     def tick(self):
+        if self.fixed_point:
+            self.tick_fixed()
+            return
+        self.prev_x = self.x
+        self.prev_y = self.y
         if self.moving:
             buzz = False
             self.y = self.y + self.y_speed
@@ -134,29 +544,93 @@ class Ball(DisplayAsset):
             if buzz:
                 self.game.buzzer.buzz(2000,100)
             #print(self.x_speed, self.y_speed)
-          
+    
+    def tick_fixed(self):
+        # the same steps as the float physics with Fixed numbers
+        self.prev_x = self.x
+        self.prev_y = self.y
+        if self.moving:
+            buzz = False
+            self.y_fp = self.y_fp + self.y_speed_fp
+            self.y_speed_fp = self.y_speed_fp + self.gravity_fp
+            
+            if self.y_fp >= self.floor_fp and -Fixed.ONE < self.x_speed_fp < Fixed.ONE and -Fixed.ONE < self.y_speed_fp < Fixed.ONE:
+                print("stopped")
+                self.moving = False
+                self.game.ball_stopped()
+                self.y_fp = self.floor_fp - Fixed.ONE
+                self.y = self.y_fp // Fixed.ONE
+                return
+            
+            if self.y_fp >= self.floor_fp:
+                self.y_fp = self.floor_fp
+                # change y direction and slow down the ball, rounded to nearest
+                self.y_speed_fp = (-self.y_speed_fp * self.energy_loss_fp + Fixed.HALF) // Fixed.ONE
+                self.x_speed_fp = (self.x_speed_fp * self.energy_loss_fp + Fixed.HALF) // Fixed.ONE
+                buzz = True
+            
+            self.x_fp = self.x_fp + self.x_speed_fp
+            if self.x_fp >= self.right_fp:
+                self.x_fp = self.right_fp
+                self.x_speed_fp = -self.x_speed_fp
+                buzz = True
+            if self.x_fp < self.left_fp:
+                self.x_fp = self.left_fp
+                self.x_speed_fp = -self.x_speed_fp
+                buzz = True
+            
+            self.x = self.x_fp // Fixed.ONE
+            self.y = self.y_fp // Fixed.ONE
+            if buzz:
+                self.game.buzzer.buzz(2000,100)
             
     def go(self, angle, speed):
+        # x_speed and y_speed keep the speeds of the shot with fixed point
         self.x_speed = math.cos(math.radians(angle)) * speed
         self.y_speed = math.sin(math.radians(angle)) * speed
+        self.x_speed_fp = Fixed.from_float(self.x_speed)
+        self.y_speed_fp = Fixed.from_float(self.y_speed)
         self.moving = True
 
+    def paint(fb):
+        fb.rect(1, 1, 5, 5, 1)
+        fb.rect(2, 0, 3, 7, 1)
+        fb.rect(0, 2, 7, 3, 1)
+
     def draw(self):
-        game.display.rect(int(self.x)-2, int(self.y)-2, 5, 5, 1)
-        game.display.rect(int(self.x)-1, int(self.y)-3, 3, 7, 1)
-        game.display.rect(int(self.x)-3, int(self.y)-1, 7, 3, 1)
+        self.game.display.blit(self.sprite, int(self.x)-3, int(self.y)-3, 0)
     
 
 class Star(DisplayAsset):
     STAR_SIZE = 3
+    BRIGHTNESS_STEP_FP = Fixed.from_float(0.3)
     
     def __init__(self, game, x, y):
         super().__init__(game, x, y)
+        # one sprite for every brightness, a star is drawn before its first tick so
+        # the brightness can be STAR_SIZE too
+        self.sprites = [game.sprites.get("star" + str(size), 2 * size + 1, 2 * size + 1,
+                                         lambda fb: Star.paint(fb, size))
+                        for size in range(self.STAR_SIZE + 1)]
+        self.reset(x, y)
+    
+    def reset(self, x, y):
+        self.x = x
+        self.y = y
         self.y_speed = 0
-        self.brightness = random.randint(0, self.STAR_SIZE)
+        self.brightness = self.game.rng.randint(0, self.STAR_SIZE)
         self.falling = False
+        # with fixed point the brightness, y and y_speed are Fixed, see Ball
+        self.fixed_point = self.game.FIXED_POINT
+        self.brightness_fp = self.brightness * Fixed.ONE
+        self.y_fp = Fixed.from_float(y)
+        self.y_speed_fp = 0
+        self.gravity_fp = Fixed.from_float(self.game.GRAVITY)
     
     def tick(self):
+        if self.fixed_point:
+            self.tick_fixed()
+            return
         self.brightness = (self.brightness + 0.3) % self.STAR_SIZE
         if self.falling:
             self.y = self.y + self.y_speed
@@ -166,36 +640,136 @@ class Star(DisplayAsset):
                     print("stopped")
                     self.falling = False
                     self.game.remove_asset(self)
+    
+    def tick_fixed(self):
+        self.brightness_fp = (self.brightness_fp + self.BRIGHTNESS_STEP_FP) % (self.STAR_SIZE * Fixed.ONE)
+        self.brightness = self.brightness_fp // Fixed.ONE
+        if self.falling:
+            self.y_fp = self.y_fp + self.y_speed_fp
+            self.y_speed_fp = self.y_speed_fp + self.gravity_fp
+            self.y = self.y_fp // Fixed.ONE
+            
+            if self.y >= self.game.display.height:
+                print("stopped")
+                self.falling = False
+                self.game.remove_asset(self)
             
     def fall(self):
         self.falling = True
 
+    def paint(fb, size):
+        # a star with arms of size pixels around the center (size, size)
+        end = 2 * size
+        fb.line(0, 0, end, end, 1)
+        fb.line(end, 0, 0, end, 1)
+        fb.line(0, size, end, size, 1)
+        fb.line(size, 0, size, end, 1)
+
     def draw(self):
-        self.game.display.line(int(self.x - int(self.brightness)), int(self.y - int(self.brightness)),
-                               int(self.x + int(self.brightness)), int(self.y + int(self.brightness)), 1)
-        self.game.display.line(int(self.x + int(self.brightness)), int(self.y - int(self.brightness)),
-                               int(self.x - int(self.brightness)), int(self.y + int(self.brightness)), 1)
-        self.game.display.line(int(self.x - int(self.brightness)), int(self.y),
-                               int(self.x + int(self.brightness)), int(self.y), 1)
-        self.game.display.line(int(self.x), int(self.y - int(self.brightness)),
-                               int(self.x), int(self.y + int(self.brightness)), 1)
-        
-class Curtain(DisplayAsset):
-    def __init__(self, game):
+        size = int(self.brightness)
+        self.game.display.blit(self.sprites[size], int(self.x) - size, int(self.y) - size, 0)
+        
+class Transition(DisplayAsset):
+    # Screen effects done by the display itself with a few commands per tick instead of
+    # redrawing and sending frames. step(i) runs on every tick with i from 1 to duration,
+    # finish() puts the display back to normal, also when the transition is removed early.
+    LAYER = Scene.LAYER_OVERLAY
+    
+    def __init__(self, game, duration, callback = None):
         super().__init__(game)
+        self.duration = duration
+        self.callback = callback
         self.i = 0
+        self.finished = False
     
     def tick(self):
-        self.i = self.i+1
-        if self.i == self.game.display.width/2:
+        self.i = self.i + 1
+        self.step(self.i)
+        if self.i == self.duration:
+            self.finish()
             self.game.remove_asset(self)
-            
-    def draw(self):
-        self.game.display.fill_rect(0, 0, int(self.game.display.width/2 - self.i), self.game.display.height, 0)
-        self.game.display.fill_rect(int(self.game.display.width/2 + self.i) , 0, self.game.display.width, self.game.display.height, 0)
-        
-            
+            if self.callback is not None:
+                self.callback(self)
+    
+    def step(self, i):
+        pass
+    
+    def finish(self):
+        self.finished = True
+    
+    def removed(self):
+        if not self.finished:
+            self.finish()
+        super().removed()
+
+class FadeIn(Transition):
+    # raises the contrast from 0 to the maximum
+    def __init__(self, game, duration, callback = None):
+        super().__init__(game, duration, callback)
+        self.contrast = game.oled.contrast
+        self.step(0)  # dark from the first frame on
+    
+    def step(self, i):
+        self.game.display_command(self.contrast, 255 * i // self.duration)
+    
+    def finish(self):
+        super().finish()
+        self.game.display_command(self.contrast, 255)
+
+class Flash(Transition):
+    # inverts the screen flashes times for period ticks
+    def __init__(self, game, flashes, period = 3, callback = None):
+        super().__init__(game, 2 * flashes * period, callback)
+        self.period = period
+        self.invert = game.oled.invert
+    
+    def step(self, i):
+        if i % self.period == 0:
+            self.game.display_command(self.invert, (i // self.period) % 2)
+    
+    def finish(self):
+        super().finish()
+        self.game.display_command(self.invert, 0)
+
+class RollIn(Transition):
+    # the screen rolls up into place by moving the start line of the display
+    def __init__(self, game, duration, callback = None):
+        super().__init__(game, duration, callback)
+        self.start_line = game.oled.start_line
+        self.step(0)
+    
+    def step(self, i):
+        self.game.display_command(self.start_line, self.game.display.height * (self.duration - i) // (self.duration + 1))
+    
+    def finish(self):
+        super().finish()
+        self.game.display_command(self.start_line, 0)
+
+class ScrollOut(Transition):
+    # The display scrolls the screen out sideways by itself. Frames aren't sent while it
+    # scrolls, after it the whole frame is sent again.
+    def __init__(self, game, duration, left = True, callback = None):
+        super().__init__(game, duration, callback)
+        self.left = left
+        self.scroll = game.oled.scroll_horizontal
+        self.scroll_stop = game.oled.scroll_stop
+    
+    def step(self, i):
+        if i == 1:
+            self.game.display_frozen = True
+            if self.game.pipeline is not None:
+                # the display RAM must not be written while it scrolls, the worker may still have a frame
+                self.game.pipeline.flush()
+            self.game.display_command(self.scroll, self.left)
+    
+    def finish(self):
+        super().finish()
+        if self.game.display_frozen:
+            self.game.display_command(self.scroll_stop)
+            self.game.display_frozen = False
+
 class Menu(DisplayAsset):
+    LAYER = Scene.LAYER_UI
     
     FLICKER_DURATION = 500  # in milliseconds
     FLICKER_STEP_DURATION = 50  # in milliseconds
@@ -235,15 +809,16 @@ class Menu(DisplayAsset):
 
     def choose_option(self):
         # Start flickering the chosen option
-        self.flicker_start_time = time.ticks_ms()
-        flicker_timer = Timer(1)
-        flicker_timer.init(period=self.FLICKER_DURATION, mode=Timer.ONE_SHOT, callback=self.finalize_flicker)
+        self.flicker_start_time = self.game.time_ms()
+        self.game.timers.cancel(self.flicker_timer)
+        self.flicker_timer = self.game.timers.one_shot(self.FLICKER_DURATION, self.finalize_flicker)
 
     def should_flicker(self):
         # Check if flickering duration has elapsed
-        return self.flicker_start_time >  0 and int(time.ticks_diff(time.ticks_ms(), self.flicker_start_time) / self.FLICKER_STEP_DURATION)%2
+        return self.flicker_start_time >  0 and int(time.ticks_diff(self.game.time_ms(), self.flicker_start_time) / self.FLICKER_STEP_DURATION)%2
 
     def finalize_flicker(self, timer):
+        self.flicker_timer = None
         self.flicker_start_time = 0
         (option, handler) = self.options[self.selected_option]
         if handler is not None:
@@ -261,10 +836,16 @@ class Menu(DisplayAsset):
             self.game.buzzer.buzz(1000, 200)  # Add buzzer feedback
 
 class FadingText(DisplayAsset):
+    LAYER = Scene.LAYER_UI
     FADE_COUNT = 15
     
     def __init__(self, game, x, y, text):
         super().__init__(game, x, y)
+        self.reset(x, y, text)
+    
+    def reset(self, x, y, text):
+        self.x = x
+        self.y = y
         self.text = text
         self.x = self.x - int(Utils.text_width(text)/2)
         if self.x + Utils.text_width(text) > self.game.display.width:
@@ -286,14 +867,20 @@ class FadingText(DisplayAsset):
         self.game.remove_asset(self)
 
 class Bar(DisplayAsset):
+    LAYER = Scene.LAYER_UI
+    
     def __init__(self, game, x, y, max_value=7, value = 0):
         super().__init__(game,x, y)
         self.max_value = max_value  # Total number of fill iterations
         self.WIDTH = 20
         self.HEIGHT = 5
+        self.timer = None
+        self.reset()
+    
+    def reset(self):
         self.value = 1  # Current iteration count
-        self.timer = Timer(2)  # Create a new timer
-        self.timer.init(period=400, mode=Timer.PERIODIC, callback=self.update_fill)  # Set timer callback
+        self.game.timers.cancel(self.timer)
+        self.timer = self.game.timers.periodic(400, self.update_fill)
 
     def draw(self):
         # Draw the rectangle with the current fill level
@@ -305,9 +892,16 @@ class Bar(DisplayAsset):
         self.value = (self.value+1)% (self.max_value+1)
     
     def destroy(self):
-        self.timer.deinit()
+        self.game.timers.cancel(self.timer)
+        self.timer = None
+    
+    def removed(self):
+        self.destroy()
+        super().removed()
      
 class SlidingText(DisplayAsset):
+    LAYER = Scene.LAYER_UI
+    
     def __init__(self, game, y, text, speed, size=1, from_right=False, button_handler = None):
         super().__init__(game, 0, y, button_handler)
         self.text = text
@@ -347,6 +941,10 @@ class Utils():
     
     CHAR_WIDTH = 8
     
+    ATLAS_HEADER = '<4sBBBBHH'
+    ATLAS_VLSB = 1
+    ATLAS_MIRRORED = 1
+    
     def dist(x1,y1,x2,y2):
         return math.sqrt((x1-x2)*(x1-x2)+(y1-y2)*(y1-y2))
     
@@ -357,11 +955,6 @@ class Utils():
     def assets_distance(asset1, asset2):
         return math.sqrt((asset1.x-asset2.x)*(asset1.x-asset2.x)+(asset1.y-asset2.y)*(asset1.y-asset2.y))
     
-    def one_shot_timer(duration, callback):
-        print("start timer")
-        timer = Timer(3)
-        timer.init(period=duration, mode=Timer.ONE_SHOT, callback=callback)
-        
     def load_pbm(file):
         with open(file, 'rb') as f:
             f.readline() # Magic number
@@ -388,11 +981,50 @@ class Utils():
                 current_data = all_frames[row_start:row_end]
                 frame_data.extend(current_data)
             framebuffer = framebuf.FrameBuffer(frame_data, frame_width, height, framebuf.MONO_HLSB)
+            if flip:
+                framebuffer = Utils.mirror(framebuffer, frame_width, height)
             frames.append(framebuffer)
         return (frames, frame_width, height)
 
+    def mirror(frame, width, height):
+        # slow pixel by pixel copy, atlas files (see tools/compile_assets.py) come with mirrored frames
+        mirrored = framebuf.FrameBuffer(bytearray(((width + 7) // 8) * height), width, height, framebuf.MONO_HLSB)
+        for y in range(height):
+            for x in range(width):
+                mirrored.pixel(width - 1 - x, y, frame.pixel(x, y))
+        return mirrored
+
+    def load_atlas(file, flip):
+        # Loads an atlas made by tools/compile_assets.py. The frames are already sliced
+        # so every frame is a FrameBuffer over a part of a single buffer.
+        with open(file, 'rb') as f:
+            (magic, layout, flags, num_of_sprites, _, width, height) = struct.unpack(Utils.ATLAS_HEADER, f.read(12))
+            if magic != b'ATL1':
+                raise ValueError(f'{file} is not an atlas')
+            if layout == Utils.ATLAS_VLSB:
+                (layout, frame_size) = (framebuf.MONO_VLSB, width * ((height + 7) // 8))
+            else:
+                (layout, frame_size) = (framebuf.MONO_HLSB, ((width + 7) // 8) * height)
+            data = bytearray(frame_size * num_of_sprites)
+            if flip and flags & Utils.ATLAS_MIRRORED:
+                f.seek(12 + len(data))
+                flip = False
+            f.readinto(data)
+            print(f'loaded atlas {file}. {num_of_sprites} frames {width}x{height}')
+        
+        data = memoryview(data)
+        frames = []
+        for i in range(num_of_sprites):
+            frame = framebuf.FrameBuffer(data[i * frame_size:(i + 1) * frame_size], width, height, layout)
+            if flip:
+                frame = Utils.mirror(frame, width, height)
+            frames.append(frame)
+        return (frames, width, height)
+
 
 class Score(DisplayAsset):
+    LAYER = Scene.LAYER_UI
+    
     def __init__(self, game):
         super().__init__(game, 5, 5)
         self.value = 0
@@ -404,6 +1036,8 @@ class Score(DisplayAsset):
         self.game.display.text(str(self.value), self.x, self.y)
 
 class Bitmap(DisplayAsset):
+    LAYER = Scene.LAYER_BACKGROUND
+    
     def __init__(self, game, x, y, file, button_handler = None):
         super().__init__(game, x, y, button_handler)
         (data, self.width, self.height) = Utils.load_pbm(file)
@@ -415,7 +1049,10 @@ class Bitmap(DisplayAsset):
 class Animation(DisplayAsset):
     def __init__(self, game, x, y, file, num_of_sprites, flip = False, animation_speed = 3):
         super().__init__(game, x, y)
-        (self.frames, self.width, self.height) = Utils.load_animation(file, num_of_sprites, flip)
+        if file.endswith('.atl'):
+            (self.frames, self.width, self.height) = Utils.load_atlas(file, flip)
+        else:
+            (self.frames, self.width, self.height) = Utils.load_animation(file, num_of_sprites, flip)
         self.current_frame = 0
         self.animation_speed = animation_speed
         
@@ -455,15 +1092,49 @@ class Cue(DisplayAsset):
     ANGLE_STEP = 10
     INITIAL_ANGLE = -40
     
+    # Cue line and direction dot positions for every angle and gap, computed once per
+    # cue position: (x, y) -> (lines, dots). Lines are keyed by angle * 100 + gap.
+    geometry = {}
+    
     def __init__(self, game, x, y):
         super().__init__(game, x, y)
-        self.angle = -40        
         self.MIN_GAP = 5
         self.MAX_GAP = 15
+        self.cue_size = 20
+        (self.lines, self.dots) = self.get_geometry()
+        self.reset()
+    
+    def reset(self):
+        self.angle = -40        
         self.gap_step = 1
         self.gap = self.MAX_GAP
-        self.cue_size = 20
         self.angle_step = self.ANGLE_STEP
+    
+    def angle_point(x, y, angle, radius):
+        x1 = int(x - math.cos(math.radians(angle)) * radius)
+        y1 = int(y - math.sin(math.radians(angle)) * radius)
+        return (x1, y1)
+    
+    def get_geometry(self):
+        key = (self.x, self.y)
+        if key not in Cue.geometry:
+            lines = {}
+            dots = {}
+            for angle in range(self.MAX_ANGLE, self.MIN_ANGLE + 1, self.ANGLE_STEP):
+                for gap in range(self.MIN_GAP, self.MAX_GAP + 1):
+                    points = array('h')
+                    for i in range(-1,2): # 3 pixels wide
+                        for j in range(-1,2):
+                            points.extend(Cue.angle_point(self.x + i, self.y + j, angle, gap))
+                            points.extend(Cue.angle_point(self.x + i, self.y + j, angle, self.cue_size + gap))
+                    lines[angle * 100 + gap] = points
+                
+                points = array('h')
+                for i in range(1,20,4):
+                    points.extend(Cue.angle_point(self.x, self.y, angle + 180, i))
+                dots[angle] = points
+            Cue.geometry[key] = (lines, dots)
+        return Cue.geometry[key]
         
     def tick(self):
         if self.gap == self.MAX_GAP or self.gap == self.MIN_GAP:
@@ -480,26 +1151,22 @@ class Cue(DisplayAsset):
             self.game.shoot(self.angle)
                 
     def draw(self):
-    
-        def angle_point(x, y, angle, radius):
-            x1 = int(x - math.cos(math.radians(angle)) * radius)
-            y1 = int(y - math.sin(math.radians(angle)) * radius)
-            return (x1, y1)
+        display = self.game.display
         
         # draw cue
-        for i in range(-1,2): # 3 pixels wide
-            for j in range(-1,2):
-                (x1, y1) = angle_point(self.x + i, self.y + j, self.angle, self.gap)
-                (x2, y2) = angle_point(self.x + i, self.y + j, self.angle, self.cue_size + self.gap)
-                self.game.display.line(x1, y1, x2, y2, 1)
+        points = self.lines[self.angle * 100 + self.gap]
+        for i in range(0, len(points), 4):
+            display.line(points[i], points[i + 1], points[i + 2], points[i + 3], 1)
         
         # draw dots for the ball direction    
-        for i in range(1,20,4):
-            (x1, y1) = angle_point(self.x, self.y, self.angle + 180, i)
-            self.game.display.pixel(x1, y1, 1)
+        points = self.dots[self.angle]
+        for i in range(0, len(points), 2):
+            display.pixel(points[i], points[i + 1], 1)
         
             
 class Border(DisplayAsset):
+    LAYER = Scene.LAYER_BACKGROUND
+    
     def __init__(self, game):
         super().__init__(game)
 
@@ -511,44 +1178,686 @@ class Border(DisplayAsset):
         self.game.display.vline(0, 0, height, 1)
         self.game.display.vline(width - 1, 0, height, 1)
         
+class CollisionGrid:
+    # Uniform grid over the screen used to find the stars near the path of the ball
+    CELL_SIZE = 16
+    
+    def __init__(self, width, height):
+        self.columns = width // self.CELL_SIZE + 1
+        self.rows = height // self.CELL_SIZE + 1
+        self.cells = [[] for i in range(self.columns * self.rows)]
+    
+    def cell(self, x, y):
+        column = min(max(int(x) // self.CELL_SIZE, 0), self.columns - 1)
+        row = min(max(int(y) // self.CELL_SIZE, 0), self.rows - 1)
+        return row * self.columns + column
+    
+    def clear(self):
+        for cell in self.cells:
+            del cell[:]
+    
+    def add(self, asset):
+        self.cells[self.cell(asset.x, asset.y)].append(asset)
+    
+    def remove(self, asset):
+        cell = self.cells[self.cell(asset.x, asset.y)]
+        if asset in cell:
+            cell.remove(asset)
+    
+    def query(self, x0, y0, x1, y1, radius, hits):
+        # Appends to hits every asset within radius of the segment (x0, y0) - (x1, y1).
+        # Only the cells around the bounding box of the segment are checked.
+        first = self.cell(min(x0, x1) - radius, min(y0, y1) - radius)
+        last = self.cell(max(x0, x1) + radius, max(y0, y1) + radius)
+        dx = x1 - x0
+        dy = y1 - y0
+        length2 = dx * dx + dy * dy
+        radius2 = radius * radius
+        for row in range(first // self.columns, last // self.columns + 1):
+            for column in range(first % self.columns, last % self.columns + 1):
+                for asset in self.cells[row * self.columns + column]:
+                    px = asset.x - x0
+                    py = asset.y - y0
+                    if length2 > 0:
+                        # closest point of the segment to the asset
+                        t = (px * dx + py * dy) / length2
+                        if t > 1:
+                            t = 1
+                        elif t < 0:
+                            t = 0
+                        px = px - t * dx
+                        py = py - t * dy
+                    if px * px + py * py <= radius2:
+                        hits.append(asset)
+        
+class Rng:
+    # xorshift32, gives the same numbers for the same seed on the device and on a PC
+    def __init__(self, seed=1):
+        self.seed(seed)
+    
+    def seed(self, seed):
+        self.state = (seed & 0xFFFFFFFF) or 0x9E3779B9  # the state must never be 0
+    
+    def next(self):
+        x = self.state
+        x = x ^ ((x << 13) & 0xFFFFFFFF)
+        x = x ^ (x >> 17)
+        x = x ^ ((x << 5) & 0xFFFFFFFF)
+        self.state = x
+        return x
+    
+    def randint(self, a, b):
+        return a + self.next() % (b - a + 1)
+
+class StarLayout:
+    # Poisson-disk sampling by dart throwing in the area x0..x1, y0..y1. A star fits when it is
+    # at least min_distance from the other stars. The area is covered by a grid with cells so
+    # small that only one star fits in a cell, so a candidate is only checked against the
+    # stars in the cells around it. After MAX_ATTEMPTS candidates in a row that don't fit the
+    # level gets fewer stars, so it always finishes.
+    MAX_ATTEMPTS = 30
+    
+    def __init__(self, x0, y0, x1, y1, min_distance):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.min_distance2 = min_distance * min_distance
+        self.cell_size = max(1, int(min_distance / 1.415))  # the diagonal of a cell is shorter than min_distance
+        self.reach = (min_distance + self.cell_size - 1) // self.cell_size
+        self.columns = (x1 - x0) // self.cell_size + 1
+        self.rows = (y1 - y0) // self.cell_size + 1
+        self.cells = bytearray(self.columns * self.rows)  # star number + 1, 0 for an empty cell
+    
+    def generate(self, rng, count):
+        # count stars at most, up to 255
+        cells = self.cells
+        for i in range(len(cells)):
+            cells[i] = 0
+        positions = []
+        attempts = 0
+        while len(positions) < count and attempts < self.MAX_ATTEMPTS:
+            x = rng.randint(self.x0, self.x1)
+            y = rng.randint(self.y0, self.y1)
+            column = (x - self.x0) // self.cell_size
+            row = (y - self.y0) // self.cell_size
+            if self.fits(positions, x, y, column, row):
+                positions.append((x, y))
+                cells[row * self.columns + column] = len(positions)
+                attempts = 0
+            else:
+                attempts = attempts + 1
+        return positions
+    
+    def fits(self, positions, x, y, column, row):
+        for r in range(max(0, row - self.reach), min(self.rows, row + self.reach + 1)):
+            for c in range(max(0, column - self.reach), min(self.columns, column + self.reach + 1)):
+                star = self.cells[r * self.columns + c]
+                if star:
+                    (other_x, other_y) = positions[star - 1]
+                    if (x - other_x) * (x - other_x) + (y - other_y) * (y - other_y) < self.min_distance2:
+                        return False
+        return True
+
+class LevelPack:
+    # Star positions of precomputed levels, made by tools/compile_levels.py.
+    # Header: magic, number of levels, stars per level, reserved. Then x, y bytes of every star.
+    HEADER = '<4sHBB'
+    
+    def __init__(self, file):
+        with open(file, 'rb') as f:
+            (magic, self.count, self.stars, _) = struct.unpack(self.HEADER, f.read(8))
+            if magic != b'LVL1':
+                raise ValueError(f'{file} is not a level pack')
+            if self.count == 0 or self.stars == 0:
+                raise ValueError(f'{file} has no levels')
+            self.data = bytearray(self.count * self.stars * 2)
+            f.readinto(self.data)
+        print(f'loaded level pack {file}. {self.count} levels')
+    
+    def positions(self, level, count):
+        # the first count stars of the level, levels repeat after the last one
+        start = (level % self.count) * self.stars * 2
+        end = start + min(count, self.stars) * 2
+        return [(self.data[i], self.data[i + 1]) for i in range(start, end, 2)]
+
+class SaveLog:
+    # High scores and settings kept in flash as an append-only log of fixed size records:
+    # magic, sequence number, setting flags, the TOP scores and a crc32 of the rest. A save
+    # appends one record, so a reset in the middle of a write can only tear the last one.
+    # Loading reads the last record (and steps back over a torn one), so it takes the same
+    # time however long the log is. After MAX_RECORDS the log is compacted: the last record
+    # is written to a new file that replaces the log. When the log is gone or has no valid
+    # record, a reset cut the compaction off and the new file is used.
+    MAGIC = b'SV'
+    RECORD = '<2sIB5H'
+    TOP = 5  # number of scores in RECORD
+    MAX_RECORDS = 64
+    MUSIC_MUTE = 1
+    SOUND_MUTE = 2
+    
+    def __init__(self, file):
+        self.file = file
+        self.data_size = struct.calcsize(self.RECORD)
+        self.size = self.data_size + 4  # and the crc
+        self.buffer = bytearray(self.size)
+        self.sequence = 0
+        self.records = 0
+        self.flags = 0
+        self.scores = [0] * self.TOP
+        self.load()
+    
+    def load(self):
+        temp = self.file + '.tmp'
+        if not self.read(self.file):
+            if not self.read(temp):
+                return  # nothing saved yet
+            try:
+                self.replace(temp)
+                self.records = 1
+            except OSError as e:
+                print(f'restoring {temp} failed: {e}')
+                self.records = self.MAX_RECORDS  # the next save compacts the log
+        print(f'loaded {self.file}: scores {self.scores}, flags {self.flags}')
+    
+    def read(self, file):
+        # loads the last valid record of file, False when there is none
+        try:
+            length = os.stat(file)[6]
+        except OSError:
+            return False
+        self.records = length // self.size
+        found = False
+        with open(file, 'rb') as f:
+            for i in range(self.records - 1, -1, -1):
+                f.seek(i * self.size)
+                f.readinto(self.buffer)
+                if self.parse(self.buffer):
+                    found = True
+                    break
+        if length % self.size != 0:
+            self.records = self.MAX_RECORDS  # a torn write, the next save compacts the log
+        return found
+    
+    def parse(self, record):
+        (crc,) = struct.unpack_from('<I', record, self.data_size)
+        if crc != binascii.crc32(memoryview(record)[:self.data_size]) & 0xFFFFFFFF:
+            return False
+        values = struct.unpack_from(self.RECORD, record)
+        if values[0] != self.MAGIC:
+            return False
+        self.sequence = values[1]
+        self.flags = values[2]
+        self.scores = list(values[3:])
+        return True
+    
+    def save(self, flags, scores):
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.flags = flags
+        self.scores = list(scores)
+        struct.pack_into(self.RECORD, self.buffer, 0, self.MAGIC, self.sequence, flags, *scores)
+        struct.pack_into('<I', self.buffer, self.data_size, binascii.crc32(memoryview(self.buffer)[:self.data_size]) & 0xFFFFFFFF)
+        try:
+            if self.records >= self.MAX_RECORDS:
+                self.compact()
+            else:
+                with open(self.file, 'ab') as f:
+                    f.write(self.buffer)
+                self.records = self.records + 1
+        except OSError as e:
+            print(f'saving {self.file} failed: {e}')
+    
+    def compact(self):
+        temp = self.file + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(self.buffer)
+        self.replace(temp)
+        self.records = 1
+        print(f'compacted {self.file}')
+    
+    def replace(self, temp):
+        try:
+            os.rename(temp, self.file)
+        except OSError:
+            # some file systems don't rename over an existing file, after a reset in between
+            # load() finds the records in temp
+            os.remove(self.file)
+            os.rename(temp, self.file)
+
+class AllocProfiler:
+    # Measures the heap allocated by tick() and draw() of every asset class in every frame.
+    # The last FRAMES frames are kept in a ring buffer, dump() prints them over serial and
+    # to_json() returns them as JSON. On a PC tracemalloc is used instead of gc.mem_alloc().
+    FRAMES = 32
+    
+    def __init__(self):
+        # every frame is a dict: class name -> [bytes allocated in tick, in draw, number of calls]
+        self.frames = [{} for i in range(self.FRAMES)]
+        self.frame_numbers = [-1] * self.FRAMES
+        self.frame = 0
+        self.collections = 0  # measurements that were spoiled by a garbage collection
+        self.tracemalloc = None
+        if not hasattr(gc, 'mem_alloc'):
+            import tracemalloc
+            tracemalloc.start()
+            self.tracemalloc = tracemalloc
+        self.start_frame()
+    
+    def mark(self):
+        if self.tracemalloc is None:
+            return gc.mem_alloc()
+        self.tracemalloc.reset_peak()
+        return self.tracemalloc.get_traced_memory()[0]
+    
+    def allocated(self, mark):
+        if self.tracemalloc is None:
+            return gc.mem_alloc() - mark
+        return self.tracemalloc.get_traced_memory()[1] - mark
+    
+    def tick(self, asset):
+        mark = self.mark()
+        asset.tick()
+        self.record(asset, 0, self.allocated(mark))
+    
+    def draw(self, asset):
+        mark = self.mark()
+        asset.draw()
+        self.record(asset, 1, self.allocated(mark))
+    
+    def record(self, asset, phase, allocated):
+        if allocated < 0:
+            # the heap shrank, a garbage collection ran during the call
+            self.collections = self.collections + 1
+            allocated = 0
+        stats = self.frames[self.frame % self.FRAMES]
+        name = type(asset).__name__
+        if name not in stats:
+            stats[name] = [0, 0, 0]
+        entry = stats[name]
+        entry[phase] = entry[phase] + allocated
+        entry[2] = entry[2] + 1
+    
+    def start_frame(self):
+        index = self.frame % self.FRAMES
+        self.frames[index].clear()
+        self.frame_numbers[index] = self.frame
+    
+    def next_frame(self):
+        self.frame = self.frame + 1
+        self.start_frame()
+    
+    def recorded_frames(self):
+        # the finished frames in the buffer, oldest first
+        first = max(0, self.frame - self.FRAMES + 1)
+        return [(number, self.frames[number % self.FRAMES]) for number in range(first, self.frame)]
+    
+    def totals(self):
+        totals = {}
+        for (number, stats) in self.recorded_frames():
+            for name in stats:
+                if name not in totals:
+                    totals[name] = [0, 0, 0]
+                for i in range(3):
+                    totals[name][i] = totals[name][i] + stats[name][i]
+        return totals
+    
+    def dump(self):
+        frames = self.recorded_frames()
+        print(f'allocations in the last {len(frames)} frames ({self.collections} spoiled by gc)')
+        for (number, stats) in frames:
+            print(f'frame {number}: ' + ', '.join([f'{name} {stats[name][0]}/{stats[name][1]}' for name in stats]))
+        print('total per class (tick/draw bytes, calls):')
+        totals = self.totals()
+        for name in sorted(totals, key=lambda name: -(totals[name][0] + totals[name][1])):
+            print(f'  {name}: {totals[name][0]}/{totals[name][1]} bytes, {totals[name][2]} calls')
+    
+    def to_json(self):
+        return json.dumps({"collections": self.collections,
+                           "frames": [{"frame": number, "assets": stats} for (number, stats) in self.recorded_frames()],
+                           "totals": self.totals()})
+    
+class FrameProfiler:
+    # Times the phases of the main loop with time.ticks_us and keeps the last WINDOW
+    # samples of every phase. A phase is timed once per frame, adding up all its calls.
+    WINDOW = 64
+    
+    def __init__(self):
+        self.samples = {}  # phase -> array of microseconds
+        self.counts = {}  # phase -> number of samples taken
+        self.current = {}  # phase -> microseconds in the current frame
+        self.names = {}  # asset class name -> (tick phase, draw phase), made once per class
+        self.last_frame = time.ticks_us()
+    
+    def add(self, phase, us):
+        self.current[phase] = self.current.get(phase, 0) + us
+    
+    def add_asset(self, asset, phase, us):
+        name = type(asset).__name__
+        if name not in self.names:
+            self.names[name] = ("tick " + name, "draw " + name)
+        self.add(self.names[name][phase], us)
+    
+    def end_frame(self):
+        now = time.ticks_us()
+        self.add("frame", time.ticks_diff(now, self.last_frame))
+        self.last_frame = now
+        for phase in self.current:
+            if phase not in self.samples:
+                self.samples[phase] = array('i', [0] * self.WINDOW)
+                self.counts[phase] = 0
+            self.samples[phase][self.counts[phase] % self.WINDOW] = self.current[phase]
+            self.counts[phase] = self.counts[phase] + 1
+            self.current[phase] = 0
+    
+    def stats(self, phase):
+        # (min, mean, max, p95) in microseconds over the window
+        samples = sorted(self.samples[phase][:min(self.counts[phase], self.WINDOW)])
+        return (samples[0], sum(samples) // len(samples), samples[-1], samples[(len(samples) - 1) * 95 // 100])
+    
+    def fps(self):
+        if "frame" not in self.samples:
+            return 0
+        mean = self.stats("frame")[1]
+        return 1000000 // mean if mean > 0 else 0
+    
+    def worst_phase(self):
+        # the phase with the highest mean time, not counting the whole frame
+        worst = None
+        worst_mean = 0
+        for phase in self.samples:
+            if phase != "frame":
+                mean = self.stats(phase)[1]
+                if mean > worst_mean:
+                    (worst, worst_mean) = (phase, mean)
+        return (worst, worst_mean)
+    
+    def report(self):
+        print("phase: min/mean/max/p95 us")
+        for phase in sorted(self.samples):
+            (low, mean, high, p95) = self.stats(phase)
+            print(f'{phase}: {low}/{mean}/{high}/{p95}')
+    
+class ProfilerOverlay(DisplayAsset):
+    # FPS and the slowest phase in the top right corner, drawn by the game above everything
+    UPDATE_FRAMES = 15  # the text is only updated every UPDATE_FRAMES frames
+    
+    def __init__(self, game, profiler):
+        super().__init__(game, game.display.width - 8 * Utils.CHAR_WIDTH, 0)
+        self.profiler = profiler
+        self.frames = 0
+        self.fps_text = ""
+        self.phase_text = ""
+    
+    def draw(self):
+        if self.frames % self.UPDATE_FRAMES == 0:
+            (phase, mean) = self.profiler.worst_phase()
+            self.fps_text = f'{self.profiler.fps()}fps'
+            self.phase_text = "" if phase is None else f'{phase.split(" ")[-1][:4]} {mean // 1000}ms'
+        self.frames = self.frames + 1
+        self.game.display.fill_rect(self.x, self.y, 8 * Utils.CHAR_WIDTH, 18, 0)
+        self.game.display.text(self.fps_text, self.x, self.y, 1)
+        self.game.display.text(self.phase_text, self.x, self.y + 9, 1)
+    
+class Canvas(framebuf.FrameBuffer):
+    # a frame buffer with the size and layout of the display, without a display
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray(width * ((height + 7) // 8))
+        super().__init__(self.buffer, width, height, framebuf.MONO_VLSB)
+
+class DisplayPipeline:
+    # Double buffering with the display flush on a second thread, which can run on the second
+    # core of the ESP32. The game draws into canvas while the worker sends the previous frame.
+    # At the frame boundary present() waits for the worker, copies canvas into the display
+    # buffer and hands it to the worker. Two locks are used as semaphores between the threads.
+    # Whoever talks to the display outside of the worker must hold the bus lock.
+    def __init__(self, display):
+        import _thread
+        self.display = display
+        self.canvas = Canvas(display.width, display.height)
+        self.frame_ready = _thread.allocate_lock()  # locked until a new frame is presented
+        self.frame_done = _thread.allocate_lock()  # locked while the worker sends a frame
+        self.bus = _thread.allocate_lock()
+        self.frame_ready.acquire()
+        self.stopping = False
+        self.frames = 0
+        _thread.start_new_thread(self.worker, ())
+    
+    def worker(self):
+        while True:
+            self.frame_ready.acquire()
+            if self.stopping:
+                break
+            try:
+                with self.bus:
+                    self.display.show()
+            except OSError as e:
+                print(f'display error {e}')
+            self.frames = self.frames + 1
+            self.frame_done.release()
+        self.frame_done.release()
+    
+    def present(self):
+        self.frame_done.acquire()
+        self.display.buffer[:] = self.canvas.buffer
+        self.frame_ready.release()
+    
+    def flush(self):
+        # waits until the last presented frame is on the display
+        self.frame_done.acquire()
+        self.frame_done.release()
+    
+    def stop(self):
+        self.frame_done.acquire()
+        self.stopping = True
+        self.frame_ready.release()
+        self.flush()  # the worker releases frame_done when it exits
+
 class Game:
     GRAVITY = 0.2
+    FIXED_POINT = True  # integer physics of Ball and Star, see Fixed
     
-    def __init__(self, oled_display, button_pin, buzzer_pin):
-        self.display = oled_display
+    TICK_PERIOD_US = 33333  # game logic runs at a fixed 30 ticks per second, the frame rate follows it
+    MAX_CATCH_UP_TICKS = 5  # after a longer stall the game slows down instead of jumping ahead
+    
+    def __init__(self, oled_display, button_pin, buzzer_pin, pipelined = False):
+        # pipelined: draw into a back buffer and send the frames to the display from a second thread
+        self.oled = oled_display
+        self.pipeline = DisplayPipeline(oled_display) if pipelined else None
+        self.display = oled_display if self.pipeline is None else self.pipeline.canvas
         self.button = Button(button_pin)
-        self.buzzer = Buzzer(buzzer_pin)
-        self.assets = []
+        self.timers = TimerWheel(Timer(1))
+        self.buzzer = Buzzer(buzzer_pin, self.timers)
+        self.scene = Scene()
+        self.sprites = SpriteCache()
+        self.rng = Rng(random.getrandbits(32))  # all randomness of the game comes from here
+        self.tick_count = 0
+        self.game_time = False  # recorded and replayed sessions run on the time of the ticks
+        self.display_frozen = False  # no frames are sent while the display scrolls by itself
+        self.running = False
+        self.alloc_profiler = None
+        self.profiler = None
+        self.profiler_overlay = None
+    
+    def profile_allocations(self, enable):
+        # e.g. game.profile_allocations(True) from the REPL, then game.alloc_profiler.dump()
+        self.alloc_profiler = AllocProfiler() if enable else None
+    
+    def profile_frames(self, enable):
+        # times the main loop and shows FPS in the corner, game.profiler.report() prints the details
+        if enable:
+            self.profiler = FrameProfiler()
+            self.profiler_overlay = ProfilerOverlay(self, self.profiler)
+        else:
+            self.profiler = None
+            self.profiler_overlay = None
+    
+    def profile_call(self, asset, phase):
+        # calls tick() (phase 0) or draw() (phase 1) of the asset through the enabled profilers
+        start = time.ticks_us()
+        if self.alloc_profiler is not None:
+            if phase == 0:
+                self.alloc_profiler.tick(asset)
+            else:
+                self.alloc_profiler.draw(asset)
+        elif phase == 0:
+            asset.tick()
+        else:
+            asset.draw()
+        if self.profiler is not None:
+            self.profiler.add_asset(asset, phase, time.ticks_diff(time.ticks_us(), start))
         
+    # Changes to the assets take effect between the tick and draw phases
     def add_asset(self, asset):
-        self.assets.append(asset)
+        self.scene.add(asset)
 
     def remove_asset(self, asset):
-        if asset is not None and asset in self.assets:
-            self.assets.remove(asset)
+        if asset is not None:
+            self.scene.remove(asset)
     
     def clear_assets(self):
-        self.assets = []
+        self.scene.clear()
         
+    def record(self, file, seed = None):
+        # Records a session to replay it later with replay(file), call it before play().
+        # The replay gives the same frames on the device and in the simulator.
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.button = InputRecorder(self, self.button, file, seed)
+        self.start_session(seed)
+    
+    def replay(self, file):
+        self.button = InputReplay(self, file)
+        self.start_session(self.button.seed)
+    
+    def start_session(self, seed):
+        # The session doesn't depend on the time it takes to run: the seed sets every random
+        # number, the timers and the time_ms() of the game move with the ticks and every tick
+        # is drawn.
+        random.seed(seed)
+        self.rng.seed(seed)
+        self.tick_count = 0
+        self.game_time = True
+        self.timers.use_game_time()
+    
+    def end_session(self):
+        # writes the end of a recording, replay stops there
+        if self.game_time:
+            self.button.close()
+    
+    def time_ms(self):
+        # ticks_ms, or the time of the ticks in a recorded or replayed session
+        if self.game_time:
+            return self.tick_count * self.TICK_PERIOD_US // 1000
+        return time.ticks_ms()
+    
     def tick(self):
-        for asset in self.assets:
-            asset.tick()  # Update each asset's state
+        if self.game_time:
+            self.timers.advance(self.TICK_PERIOD_US)
+        # deferred timer callbacks run before the assets are ticked
+        self.timers.run()
+        self.scene.apply()
+        profiling = self.alloc_profiler is not None or self.profiler is not None
+        for asset in self.scene.ticking:
+            if asset is not None:
+                if not profiling:
+                    asset.tick()  # Update each asset's state
+                else:
+                    self.profile_call(asset, 0)
+        self.scene.apply()
+        self.tick_count = self.tick_count + 1
 
     def draw(self):
+        self.scene.apply()
         # Clear the display before rendering
         self.display.fill(0)
         
-        # Draw each asset
-        for asset in self.assets:
-            asset.draw()
+        # Draw each asset, layer by layer
+        profiling = self.alloc_profiler is not None or self.profiler is not None
+        for layer in self.scene.layers:
+            for asset in layer:
+                if asset is not None:
+                    if not profiling:
+                        asset.draw()
+                    else:
+                        self.profile_call(asset, 1)
+        self.scene.apply()
+        if self.alloc_profiler is not None:
+            self.alloc_profiler.next_frame()
+        
+        if self.profiler is None:
+            # Refresh the display
+            self.show()
+        else:
+            self.profiler_overlay.draw()
+            start = time.ticks_us()
+            self.show()
+            self.profiler.add("show", time.ticks_diff(time.ticks_us(), start))
+            self.profiler.end_frame()
+    
+    def show(self):
+        if self.display_frozen:
+            return
+        if self.pipeline is None:
+            self.display.show()
+        else:
+            self.pipeline.present()
+    
+    def display_command(self, command, arg = None):
+        # Calls a command of the display driver, e.g. game.display_command(game.oled.contrast, 0).
+        # The pipeline thread must not send a frame at the same time.
+        if self.pipeline is not None:
+            self.pipeline.bus.acquire()
+        if arg is None:
+            command()
+        else:
+            command(arg)
+        if self.pipeline is not None:
+            self.pipeline.bus.release()
 
-        # Refresh the display
-        self.display.show()
+    def run(self):
+        # Fixed timestep loop: ticks happen at TICK_PERIOD_US no matter how long a frame
+        # takes to render. After a slow frame several ticks run back to back to catch up.
+        # In a recorded or replayed session every tick is drawn, a slow frame slows the game down.
+        try:
+            self.loop()
+        except BaseException:
+            # Ctrl-C or a crash ends the recording, it has the presses up to there
+            self.end_session()
+            raise
+    
+    def loop(self):
+        self.running = True
+        next_tick = time.ticks_us()
+        catch_up = 1 if self.game_time else self.MAX_CATCH_UP_TICKS
+        while self.running:
+            now = time.ticks_us()
+            ticks = 0
+            while time.ticks_diff(now, next_tick) >= 0:
+                if ticks == catch_up:
+                    next_tick = now
+                    break
+                self.tick()
+                next_tick = time.ticks_add(next_tick, self.TICK_PERIOD_US)
+                ticks = ticks + 1
+            
+            # one frame after the ticks of this pass, so at most one frame per tick
+            if ticks > 0:
+                self.draw()
+            
+            # nothing new can be drawn before the next tick, sleep until then
+            wait = time.ticks_diff(next_tick, time.ticks_us())
+            if wait > 0:
+                time.sleep_us(wait)
 
 class CatchTheStarsGame(Game):
     
     NUM_STARS = 5
     NUM_BALLS = 7
+    MIN_STAR_DISTANCE = 7
+    LEVEL_PACK = "levels.lvl"  # optional, levels are generated when it isn't uploaded
+    SAVE_FILE = "save.log"
     SOUND_END_GAME = '0 B4 2 0;3 B4 1 0;5 B4 1 0;7 B4 2 0;10 D#4 2 0;13 C#4 2 0;16 B4 2 0;19 E4 2 0'
     
     SOUND_STAR_CAUGHT = '0 E5 1 0;2 G5 1 0;4 C6 2 0'
@@ -560,48 +1869,94 @@ class CatchTheStarsGame(Game):
     #MUSIC = '0 D4 8 0;0 D5 8 0;0 G4 8 0;8 C5 2 0;10 B4 2 0;12 G4 2 0;14 F4 1 0;15 G4 17 0;16 D4 8 0;24 C4 8 0'
     
     MUSIC = '0 E3 1 0;2 E4 1 0;4 E3 1 0;6 E4 1 0;8 E3 1 0;10 E4 1 0;12 E3 1 0;14 E4 1 0;16 A3 1 0;18 A4 1 0;20 A3 1 0;22 A4 1 0;24 A3 1 0;26 A4 1 0;28 A3 1 0;30 A4 1 0;32 G#3 1 0;34 G#4 1 0;36 G#3 1 0;38 G#4 1 0;40 E3 1 0;42 E4 1 0;44 E3 1 0;46 E4 1 0;48 A3 1 0;50 A4 1 0;52 A3 1 0;54 A4 1 0;56 A3 1 0;58 B3 1 0;60 C4 1 0;62 D4 1 0;64 D3 1 0;66 D4 1 0;68 D3 1 0;70 D4 1 0;72 D3 1 0;74 D4 1 0;76 D3 1 0;78 D4 1 0;80 C3 1 0;82 C4 1 0;84 C3 1 0;86 C4 1 0;88 C3 1 0;90 C4 1 0;92 C3 1 0;94 C4 1 0;96 G2 1 0;98 G3 1 0;100 G2 1 0;102 G3 1 0;104 E3 1 0;106 E4 1 0;108 E3 1 0;110 E4 1 0;114 A4 1 0;112 A3 1 0;116 A3 1 0;118 A4 1 0;120 A3 1 0;122 A4 1 0;124 A3 1 0;0 E6 1 1;4 B5 1 1;6 C6 1 1;8 D6 1 1;10 E6 1 1;11 D6 1 1;12 C6 1 1;14 B5 1 1;0 E5 1 6;4 B4 1 6;6 C5 1 6;8 D5 1 6;10 E5 1 6;11 D5 1 6;12 C5 1 6;14 B4 1 6;16 A5 1 1;20 A5 1 1;22 C6 1 1;24 E6 1 1;28 D6 1 1;30 C6 1 1;32 B5 1 1;36 B5 1 1;36 B5 1 1;37 B5 1 1;38 C6 1 1;40 D6 1 1;44 E6 1 1;48 C6 1 1;52 A5 1 1;56 A5 1 1;20 A4 1 6;16 A4 1 6;22 C5 1 6;24 E5 1 6;28 D5 1 6;30 C5 1 6;32 B4 1 6;36 B4 1 6;37 B4 1 6;38 C5 1 6;40 D5 1 6;44 E5 1 6;48 C5 1 6;52 A4 1 6;56 A4 1 6;64 D5 1 6;64 D6 1 1;68 D6 1 1;70 F6 1 1;72 A6 1 1;76 G6 1 1;78 F6 1 1;80 E6 1 1;84 E6 1 1;86 C6 1 1;88 E6 1 1;92 D6 1 1;94 C6 1 1;96 B5 1 1;100 B5 1 1;101 B5 1 1;102 C6 1 1;104 D6 1 1;108 E6 1 1;112 C6 1 1;116 A5 1 1;120 A5 1 1;72 A5 1 6;80 E5 1 6;68 D5 1 7;70 F5 1 7;76 G5 1 7;84 E5 1 7;78 F5 1 7;86 C5 1 7;88 E5 1 6;96 B4 1 6;104 D5 1 6;112 C5 1 6;120 A4 1 6;92 D5 1 7;94 C5 1 7;100 B4 1 7;101 B4 1 7;102 C5 1 7;108 E5 1 7;116 A4 1 7'
+    # songs compiled by tools/compile_songs.py --game, uploaded next to the game they aren't parsed at boot
+    SONG_FILES = {MUSIC: "music.bzm", SOUND_END_GAME: "sound_end_game.bzm", SOUND_STAR_CAUGHT: "sound_star_caught.bzm"}
     SPLASH = "splash3-mono.pbm"
+    MUSIC_TICK_MS = 33  # the music used to tick once per frame at about 30 frames per second
        
-    def __init__(self, oled_display, button_pin, buzzer_pin):
-        super().__init__(oled_display, button_pin, buzzer_pin)
+    def __init__(self, oled_display, button_pin, buzzer_pin, pipelined = False):
+        super().__init__(oled_display, button_pin, buzzer_pin, pipelined)
          # Add any additional initialization code here
         #self.initialize_assets()        
+        self.ball = None
         self.stars = []
+        self.star_grid = CollisionGrid(self.display.width, self.display.height)
+        self.caught_stars = []
         self.animal = None
-        self.music_mute = False
         
-        self.high_score = 0
+        # high scores and settings survive a reset, they are saved at the end of a game and
+        # when leaving the options menu
+        self.save_log = SaveLog(self.SAVE_FILE)
+        self.high_scores = list(self.save_log.scores)
+        self.music_mute = bool(self.save_log.flags & SaveLog.MUSIC_MUTE)
+        self.buzzer.mute = bool(self.save_log.flags & SaveLog.SOUND_MUTE)
+        self.settings_changed = False
+        
+        # everything that is created during a game comes from preallocated pools
+        self.ball_pool = Pool(lambda: Ball(self, 20, 40), self.NUM_BALLS)
+        self.star_pool = Pool(lambda: Star(self, 0, 0), self.NUM_STARS + 4)  # level or menu stars
+        self.text_pool = Pool(lambda: FadingText(self, 0, 0, ""), self.NUM_STARS)
+        self.cue_pool = Pool(lambda: Cue(self, 20, 40), 1)
+        self.bar_pool = Pool(self.new_bar, 1)
+        self.score_texts = ["+" + str(score) for score in range(self.NUM_STARS + 1)]
+        self.balls_used = 0
+        
+        # levels
+        self.level_rng = Rng()
+        self.level = 0
+        self.level_seed = 0
+        self.star_layout = StarLayout(35, 10, self.display.width - 5, self.display.height - 20, self.MIN_STAR_DISTANCE)
+        try:
+            self.level_pack = LevelPack(self.LEVEL_PACK)
+        except OSError:
+            self.level_pack = None
+        except ValueError as e:
+            print(e)  # levels are generated instead
+            self.level_pack = None
         #self.music = None 
-        self.music = music(self.MUSIC, pins=[Pin(23)], tempo=2)
+        self.music = None
+        if not self.music_mute:
+            self.play_music(self.MUSIC, tempo=2)
        
+    def play_music(self, song, tempo = 3, looping = True):
+        # music plays on its own hardware timer, tempo is the number of music ticks per beat
+        self.stop_music()
+        self.music = music(compile_song(song, self.SONG_FILES.get(song)), pins=[Pin(23)], tempo=tempo, looping = looping)
+        self.music.start(Timer(0), tempo * self.MUSIC_TICK_MS)
+    
+    def stop_music(self):
+        if self.music is not None:
+            self.music.stop_clock()
+            self.music = None
+    
     def play(self):
     # Main game loop
         print("play")
         self.show_splash()
-        while True:
-            game.tick()  # Update game state    
-            game.draw()  # Render the game on the OLED display
+        self.run()
             
     def add_animal(self):
-        ANIMALS = [{"file": 'bird.pbm', "num_frames" : 8, "y" : -10, "speed" : -5},
-                   {"file": 'cat.pbm', "num_frames" : 6, "y" : 16, "speed" : 5},
-                   {"file": 'bird3.pbm', "num_frames" : 6, "y" : -10, "speed" : 5},
-                   {"file": 'dog2.pbm', "num_frames" : 6, "y" : 16, "speed" : 5}]
+        # atlases are compiled from the pbm files with tools/compile_assets.py
+        ANIMALS = [{"file": 'bird.atl', "num_frames" : 8, "y" : -10, "speed" : -5, "flip" : False},
+                   {"file": 'cat.atl', "num_frames" : 6, "y" : 16, "speed" : 5, "flip" : False},
+                   {"file": 'bird3.atl', "num_frames" : 6, "y" : -10, "speed" : 5, "flip" : False},
+                   {"file": 'dog2.atl', "num_frames" : 6, "y" : 16, "speed" : 5, "flip" : False}]
         
-        animal = random.randint(0, len(ANIMALS)-1)
+        animal = self.rng.randint(0, len(ANIMALS)-1)
         print(f'new animal {animal}')
         self.animal = SlidingAnimation(self,
                                        ANIMALS[animal]["y"],
                                        ANIMALS[animal]["file"],
                                        ANIMALS[animal]["num_frames"],
-                                       ANIMALS[animal]["speed"])
+                                       ANIMALS[animal]["speed"],
+                                       ANIMALS[animal]["flip"])
         self.add_asset(self.animal)
     
     def show_splash(self, caller = None, button_pressed = None):
         print("show splash")
         self.clear_assets()
         self.add_asset(Bitmap(self,0,0,self.SPLASH, button_handler = self.main_menu))
-        self.add_asset(Curtain(self))
+        self.add_asset(FadeIn(self, 30))
         
     def main_menu(self, splash_caller, button_pressed = None):
         print("show menu")
@@ -609,32 +1964,67 @@ class CatchTheStarsGame(Game):
         menu_options = [("Start Game", self.show_instructions1),
                         ("Options", self.options_menu)]
         self.add_asset(Menu(self, 10, 13, "Hi there!", menu_options))
-        self.add_asset(Star(self, 10,10))
-        self.add_asset(Star(self, 110,5))
-        self.add_asset(Star(self, 80,60))
-        self.add_asset(Star(self, 15,55))
+        self.add_asset(self.new_star(10,10))
+        self.add_asset(self.new_star(110,5))
+        self.add_asset(self.new_star(80,60))
+        self.add_asset(self.new_star(15,55))
         
     def options_menu(self, main_menu_caller):
         print("show options menu")
         self.remove_asset(main_menu_caller)
         menu_options = [("Music On/Off", self.toggle_music),
                         ("Sound On/Off", self.toggle_sound),
-                        ("Back", self.main_menu)]
+                        ("Stats On/Off", self.toggle_profiler),
+                        ("Back", self.leave_options)]
         self.add_asset(Menu(self, 10, 10, "Options", menu_options))
         
+    def leave_options(self, menu):
+        if self.settings_changed:
+            self.save()
+        self.main_menu(menu)
+    
+    def save(self):
+        flags = (SaveLog.MUSIC_MUTE if self.music_mute else 0) | (SaveLog.SOUND_MUTE if self.buzzer.mute else 0)
+        if self.save_log is not None:
+            self.save_log.save(flags, self.high_scores)
+        self.settings_changed = False
+    
+    def add_score(self, score):
+        # returns True if the score made it to the high scores
+        for i in range(len(self.high_scores)):
+            if score > self.high_scores[i]:
+                self.high_scores.insert(i, score)
+                self.high_scores.pop()
+                return True
+        return False
+    
+    def start_session(self, seed):
+        # recorded and replayed sessions start without high scores and don't save them, and
+        # generate their levels from the seed, so the frames only depend on the recording
+        super().start_session(seed)
+        self.save_log = None
+        self.high_scores = [0] * SaveLog.TOP
+        self.level_pack = None
+    
+    def toggle_profiler(self, menu):
+        self.profile_frames(self.profiler is None)
+        print(f'profiler: {self.profiler is not None}')
+    
     def toggle_sound(self, menu):
         print('sound on/off')
         self.buzzer.toggle_mute()
+        self.settings_changed = True
 
     def toggle_music(self, menu):
         self.music_mute = not self.music_mute
+        self.settings_changed = True
         print(f'music mute: {self.music_mute}')
         if self.music_mute:
-            self.music = None
+            self.stop_music()
             #music('', looping = False)
             self.buzzer.stop()
         else:
-            self.music = music(self.MUSIC, pins=[Pin(23)])
+            self.play_music(self.MUSIC)
         
             
     def show_instructions1(self, caller = None):
@@ -651,7 +2041,7 @@ class CatchTheStarsGame(Game):
     def show_high_score(self,  caller = None, button_pressed = None):
         self.clear_assets()
         self.add_asset(SlidingText(self, 10, "Ready?", 8, button_handler = self.start_game))  # Add the SlidingText asset        
-        self.add_asset(SlidingText(self, 30, f"High score is {self.high_score}", 8))  # Add the SlidingText asset
+        self.add_asset(SlidingText(self, 30, f"High score is {self.high_scores[0]}", 8))  # Add the SlidingText asset
         
     def start_game(self,  caller = None, button_pressed = None):
         #self.remove_asset(menu)
@@ -660,7 +2050,8 @@ class CatchTheStarsGame(Game):
         self.score = Score(self)
         self.add_asset(self.score)
         
-        self.balls = []
+        self.balls_used = 0
+        self.level = 0
         
         self.start_level()
         
@@ -674,68 +2065,106 @@ class CatchTheStarsGame(Game):
             self.remove_asset(caller)
         
         self.add_asset(Border(self))
+        self.add_asset(RollIn(self, 10))
         
         self.stars = []
-        while len(self.stars) < self.NUM_STARS:
-            star = Star(self, random.randint(35,self.display.width-5), random.randint(10,self.display.height-20))
-            # check that this new star isn't too close to the other stars
-            collision = False
-            for other_star in self.stars:
-                if Utils.assets_distance(star, other_star) < 7:
-                    collision = True
-                    print("collision")
-            if not collision:
-                self.stars.append(star)
-                self.add_asset(star)
+        self.star_grid.clear()
+        # collect garbage now, between levels, and not while a ball is moving
+        gc.collect()
+        for (x, y) in self.star_positions(self.level):
+            star = self.new_star(x, y)
+            self.stars.append(star)
+            self.star_grid.add(star)
+            self.add_asset(star)
+        self.level = self.level + 1
         
         self.new_ball()
+    
+    def star_positions(self, level, seed = None):
+        # Positions of the stars of a level, from the level pack if there is one. Otherwise
+        # they are generated from a new seed, kept in level_seed so the level can be played
+        # again with star_positions(level, seed). Also used by the tools to make the same levels.
+        if self.level_pack is not None:
+            return self.level_pack.positions(level, self.NUM_STARS)
+        self.level_seed = self.rng.next() if seed is None else seed
+        self.level_rng.seed(self.level_seed)
+        return self.star_layout.generate(self.level_rng, self.NUM_STARS)
         
     def new_ball(self):        
-        self.ball = Ball(self, 20, 40)
+        self.ball = self.ball_pool.acquire()
+        self.ball.reset(20, 40)
         self.add_asset(self.ball)
-        self.balls.append(self.ball)
-        print(f'num balls {len(self.balls)}')
+        self.balls_used = self.balls_used + 1
+        print(f'num balls {self.balls_used}')
         
-        self.cue = Cue(self, 20, 40)
+        self.cue = self.cue_pool.acquire()
+        self.cue.reset()
         self.add_asset(self.cue)
 
-        self.speed_bar = Bar(self,3,20)
+        self.speed_bar = self.bar_pool.acquire()
+        self.speed_bar.reset()
         self.add_asset(self.speed_bar)
         
         self.stars_caught_with_current_ball = 0
         
         #print(f"ball {self.ball}")
      
+    def new_star(self, x, y):
+        star = self.star_pool.acquire()
+        star.reset(x, y)
+        return star
+    
+    def new_bar(self):
+        # pooled bars don't fill until they are reset
+        bar = Bar(self, 3, 20)
+        bar.destroy()
+        return bar
+    
     def tick(self):
-        # general game tick
-        super().tick()
-        self.check_collisions()
-        self.button.update_state()
-        if self.music is not None:
-            self.music.tick()
+        # general game tick, the assets see the press that was finished before the tick
+        if self.profiler is None:
+            self.button.update_state()
+            super().tick()
+            self.check_collisions()
+        else:
+            start = time.ticks_us()
+            self.button.update_state()
+            self.profiler.add("button", time.ticks_diff(time.ticks_us(), start))
+            super().tick()
+            start = time.ticks_us()
+            self.check_collisions()
+            self.profiler.add("collisions", time.ticks_diff(time.ticks_us(), start))
         
     def check_collisions(self):
-        for star in self.stars:
-            #print(f'dist {star}:{self.ball} - {Utils.assets_distance(star, self.ball)}')
-            if Utils.assets_distance(star, self.ball) <= self.ball.RADIUS*2:                
-                self.stars_caught_with_current_ball = self.stars_caught_with_current_ball + 1
-                add_score = self.stars_caught_with_current_ball
-                self.add_asset(FadingText(self,star.x,star.y, f"+{add_score}"))
-                self.score.add(add_score)
-                star.fall()
-                self.stars.remove(star)
-                #self.buzzer.buzz(4000,100)
-                if self.music_mute:
-                    self.music = music(self.SOUND_STAR_CAUGHT, pins=[Pin(23)], tempo=1, looping = False)
+        # check the whole path the ball moved along in the last tick so fast balls can't skip stars
+        ball = self.ball
+        if ball is None:
+            return
+        self.star_grid.query(ball.prev_x, ball.prev_y, ball.x, ball.y, ball.RADIUS*2, self.caught_stars)
+        for star in self.caught_stars:
+            self.stars_caught_with_current_ball = self.stars_caught_with_current_ball + 1
+            add_score = self.stars_caught_with_current_ball
+            text = self.text_pool.acquire()
+            text.reset(star.x, star.y, self.score_texts[add_score])
+            self.add_asset(text)
+            self.score.add(add_score)
+            self.star_grid.remove(star)
+            star.fall()
+            self.stars.remove(star)
+            #self.buzzer.buzz(4000,100)
+            if self.music_mute:
+                self.play_music(self.SOUND_STAR_CAUGHT, tempo=1, looping = False)
+        del self.caught_stars[:]
                 
     def shoot(self, angle):
         self.remove_asset(self.cue)
         self.ball.go(angle, self.speed_bar.value)
+        self.speed_bar.destroy()
         self.remove_asset(self.speed_bar)
 
     def ball_stopped(self):
         print(f'stars left {len(self.stars)}')
-        if len(self.balls) == self.NUM_BALLS:
+        if self.balls_used == self.NUM_BALLS:
             self.end_game()
         elif len(self.stars) == 0:
             self.level_completed()
@@ -744,28 +2173,39 @@ class CatchTheStarsGame(Game):
         
     def level_completed(self):
         self.add_asset(SlidingText(self, 23, "More stars!", 8,button_handler = self.start_level))  # Add the SlidingText asset
+        self.add_asset(Flash(self, 3))
         self.add_animal()
         if self.music_mute:
-            self.music = music(self.SOUND_END_GAME, pins=[Pin(23)], tempo=2, looping = False)
+            self.play_music(self.SOUND_END_GAME, tempo=2, looping = False)
                 
+    def leave_game(self, caller, button_pressed = None):
+        # the game over screen scrolls out, then the splash screen comes
+        self.remove_asset(caller)
+        self.add_asset(ScrollOut(self, 45, callback = self.show_splash))
+    
     def end_game(self):
         self.remove_asset(self.score)
         for star in self.stars:
             self.remove_asset(star)
-        if (self.score.value > self.high_score):            
+        self.star_grid.clear()
+        high_score = self.high_scores[0]
+        if self.add_score(self.score.value) or self.settings_changed:
+            self.save()
+        if (self.score.value > high_score):            
             self.add_asset(SlidingText(self, 10, "New high score!", 4))  # Add the SlidingText asset
-            self.high_score = self.score.value
         else:
             self.add_asset(SlidingText(self, 10, "Game over", 4))  # Add the SlidingText asset
-        self.add_asset(SlidingText(self, 30, f"Your score: {self.score.value}", 4, from_right = True, button_handler = self.show_splash))  # Add the SlidingText asset
+        self.add_asset(SlidingText(self, 30, f"Your score: {self.score.value}", 4, from_right = True, button_handler = self.leave_game))  # Add the SlidingText asset
         if self.music_mute:
-            self.music = music(self.SOUND_END_GAME, pins=[Pin(23)], tempo=2, looping = False)
+            self.play_music(self.SOUND_END_GAME, tempo=2, looping = False)
 
 
 if __name__ == "__main__":
     # Initialize I2C for OLED display
     i2c = I2C(-1, scl=Pin(22), sda=Pin(21))
     oled = ssd1306.SSD1306_I2C(128, 64, i2c)
+    oled.set_partial(True)  # only send the changed parts of the frame
 
+    # pipelined=True sends the frames to the display from a second thread
     game = CatchTheStarsGame(oled, 4, 23)
     game.play()
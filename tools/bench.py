@@ -0,0 +1,350 @@
+"""
+Microbenchmarks of the hot paths of the game, the same code runs on a PC and on the device.
+
+On a PC the game runs in the simulator:
+
+    python tools/bench.py                     # print the results
+    python tools/bench.py --save bench.json   # save them as the baseline
+    python tools/bench.py --compare bench.json
+
+On the device upload bench.py next to game.py and run it from the REPL:
+
+    import bench
+    bench.main(save_to='bench.json')
+    bench.main(compare_to='bench.json')
+
+Every benchmark starts from random.seed(SEED) so the runs do the same work. The time and the
+heap allocated per operation are measured in separate passes, tracemalloc is slow on a PC.
+A timing pass runs enough operations to take at least MIN_PASS_MS, shorter passes are mostly
+timer resolution and noise. All benchmarks run REPEAT rounds of one pass each and the fastest
+pass counts, that is the least disturbed one. Spread over the whole run, the passes of a
+benchmark don't all land in a spell where the machine is busy with something else.
+"""
+
+import gc
+import json
+import random
+import sys
+import time
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+SEED = 1234
+ALLOC_OPS = 20  # operations of the allocation pass
+REPEAT = 5  # rounds of timing passes, the fastest pass counts
+MIN_PASS_MS = 200  # shortest timing pass
+THRESHOLD = 10  # percent slower than the baseline that counts as a regression
+
+if MICROPYTHON:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    tracemalloc = None
+else:
+    import tracemalloc
+
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+def alloc_start():
+    gc.collect()
+    if tracemalloc is None:
+        gc.disable()
+        return gc.mem_alloc()
+    tracemalloc.start()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def alloc_stop(mark):
+    # bytes allocated since alloc_start(), -1 if a garbage collection spoiled the measurement
+    if tracemalloc is None:
+        allocated = gc.mem_alloc() - mark
+        gc.enable()
+    else:
+        allocated = tracemalloc.get_traced_memory()[0] - mark
+        tracemalloc.stop()
+    return allocated if allocated >= 0 else -1
+
+
+def timed_pass(op, state, ops):
+    gc.collect()
+    start = ticks_us()
+    for i in range(ops):
+        op(state)
+    return max(1, ticks_diff(ticks_us(), start))
+
+
+def start(setup, op):
+    random.seed(SEED)
+    state = setup()
+    op(state)  # warm up caches
+    return state
+
+
+def calibrate(setup, op, min_us):
+    # the first round, returns (ops per pass, duration of the pass, bytes allocated per op)
+    state = start(setup, op)
+    # before the timing pass, so the same ops are measured every run
+    mark = alloc_start()
+    for i in range(ALLOC_OPS):
+        op(state)
+    allocated = alloc_stop(mark)
+    per_op = allocated / ALLOC_OPS if allocated >= 0 else -1
+    # the number of ops grows until a pass takes min_us, that pass is the first timing pass
+    ops = 1
+    elapsed = timed_pass(op, state, ops)
+    while elapsed < min_us:
+        ops = max(ops * 2, ops * min_us * 5 // (elapsed * 4))
+        elapsed = timed_pass(op, state, ops)
+    return (ops, elapsed, per_op)
+
+
+def measure(setup, op, ops):
+    # the pass of a later round, from a new setup
+    return timed_pass(op, start(setup, op), ops)
+
+
+class Benchmarks:
+    # setup and op functions of every benchmark, op gets what setup returned
+    def __init__(self, module, game):
+        self.module = module
+        self.game = game
+        self.display = game.display
+
+    def list(self):
+        # (name, setup, op)
+        benchmarks = [("Star.draw", self.star_setup, self.star_draw),
+                      ("Ball.tick", self.ball_setup, self.ball_tick),
+                      ("Cue.draw", self.cue_setup, self.cue_draw),
+                      ("check_collisions", self.collisions_setup, self.check_collisions)]
+        for size in (8, 16, 24, 32):
+            benchmarks.append((f"Font.text {size}", self.font_setup(size), self.font_text))
+        benchmarks.extend([("Utils.load_animation", self.animation_setup, self.load_animation),
+                           ("Utils.load_atlas", self.atlas_setup, self.load_atlas),
+                           ("music.__init__", self.music_setup, self.music_init),
+                           ("compile_song", self.music_setup, self.compile_song),
+                           ("music.tick", self.music_tick_setup, self.music_tick),
+                           ("SSD1306.show full", self.show_setup, self.show_full),
+                           ("SSD1306.show partial", self.show_setup, self.show_partial)])
+        return benchmarks
+
+    def star_setup(self):
+        stars = [self.module.Star(self.game, random.randint(35, 123), random.randint(10, 44)) for i in range(5)]
+        return [stars, 0]
+
+    def star_draw(self, state):
+        star = state[0][state[1] % 5]
+        star.brightness = (star.brightness + 0.3) % star.STAR_SIZE
+        star.draw()
+        state[1] = state[1] + 1
+
+    def ball_setup(self):
+        ball = self.module.Ball(self.game, 20, 40)
+
+        def restart():
+            ball.reset(20, 40)
+            ball.go(random.randint(-8, -1) * 10, random.randint(2, 7))
+        # the game would start the next ball, here the same ball is shot again.
+        # run() removes the override at the end.
+        self.game.ball_stopped = restart
+        restart()
+        return ball
+
+    def ball_tick(self, ball):
+        ball.tick()
+
+    def cue_setup(self):
+        return self.module.Cue(self.game, 20, 40)
+
+    def cue_draw(self, cue):
+        cue.draw()
+        if cue.gap == cue.MAX_GAP or cue.gap == cue.MIN_GAP:
+            cue.gap_step = -cue.gap_step
+            cue.angle = cue.MAX_ANGLE if cue.angle == cue.MIN_ANGLE else cue.angle + cue.ANGLE_STEP
+        cue.gap = cue.gap + cue.gap_step
+
+    def collisions_setup(self):
+        # a level with the ball flying along the top edge, close to the stars but never catching one
+        self.game.start_game()
+        self.game.scene.apply()
+        ball = self.game.ball
+        ball.y = 2
+        return ball
+
+    def check_collisions(self, ball):
+        ball.prev_x = ball.x
+        ball.prev_y = ball.y
+        ball.x = ball.x + 5 if ball.x < 120 else 5
+        self.game.check_collisions()
+
+    def font_setup(self, size):
+        def setup():
+            return (self.module.Font(self.display), size)
+        return setup
+
+    def font_text(self, state):
+        state[0].text("Score 123", 0, 0, state[1])
+
+    def animation_setup(self):
+        with open('bird.pbm', 'rb'):
+            pass  # OSError if the sprite sheet wasn't uploaded
+        return 'bird.pbm'
+
+    def load_animation(self, file):
+        # unmirrored like the sprites of the game
+        self.module.Utils.load_animation(file, 8, False)
+
+    def atlas_setup(self):
+        with open('bird.atl', 'rb'):
+            pass
+        return 'bird.atl'
+
+    def load_atlas(self, file):
+        self.module.Utils.load_atlas(file, False)
+
+    def music_setup(self):
+        self.game.stop_music()
+        return self.game.MUSIC
+
+    def music_init(self, song):
+        self.module.music(song, pins=[self.module.Pin(23)], tempo=2)
+
+    def compile_song(self, song):
+        # parsing without the cache
+        import songs
+        songs.cache.clear()
+        songs.compile_song(song)
+
+    def music_tick_setup(self):
+        self.game.stop_music()
+        return self.module.music(self.game.MUSIC, pins=[self.module.Pin(23)], tempo=2)
+
+    def music_tick(self, player):
+        player.tick()
+
+    def show_setup(self):
+        self.display.set_partial(True)
+        self.display.fill(0)
+        self.display.show()
+        return [self.module.Star(self.game, 64, 32), 0]
+
+    def show_full(self, state):
+        self.display.shadow_valid = False
+        self.display.show()
+
+    def show_partial(self, state):
+        # a star moves one pixel per frame, two pages change
+        star = state[0]
+        star.brightness = 2
+        self.display.fill_rect(int(star.x) - 2, int(star.y) - 2, 5, 5, 0)
+        star.x = 8 + state[1] % 112
+        star.draw()
+        self.display.show()
+        state[1] = state[1] + 1
+
+
+def run(module, game, scale=1, only=None):
+    # returns {name: [ops per second, bytes per op]}
+    benchmarks = [benchmark for benchmark in Benchmarks(module, game).list()
+                  if only is None or benchmark[0].startswith(only)]
+    min_us = max(1, int(MIN_PASS_MS * 1000 * scale))
+    passes = {}  # name -> [ops per pass, fastest pass in us, bytes per op]
+    for repeat in range(REPEAT):
+        for (name, setup, op) in benchmarks:
+            if repeat == 0:
+                try:
+                    passes[name] = list(calibrate(setup, op, min_us))
+                except OSError as e:
+                    print(f'{name}: skipped ({e})')
+            elif name in passes:
+                passes[name][1] = min(passes[name][1], measure(setup, op, passes[name][0]))
+    results = {}
+    for (name, setup, op) in benchmarks:
+        if name in passes:
+            (ops, elapsed, allocated) = passes[name]
+            speed = ops * 1000000 / elapsed
+            results[name] = [speed, allocated]
+            print(f'{name}: {speed:.1f} ops/s, {1000000 / speed:.1f} us/op, {allocated:.1f} bytes/op')
+    game.__dict__.pop('ball_stopped', None)
+    return results
+
+
+def save(results, file):
+    with open(file, 'w') as f:
+        json.dump({"platform": sys.platform, "results": results}, f)
+    print(f'saved baseline {file}')
+
+
+def compare(results, file, threshold=THRESHOLD):
+    # prints the change against the baseline, returns the names of the regressed benchmarks
+    with open(file) as f:
+        baseline = json.load(f)
+    if baseline["platform"] != sys.platform:
+        print(f'warning: the baseline was made on {baseline["platform"]}')
+    regressions = []
+    for name in results:
+        if name not in baseline["results"]:
+            print(f'{name}: new')
+            continue
+        (speed, allocated) = results[name]
+        (old_speed, old_allocated) = baseline["results"][name]
+        change = (speed - old_speed) * 100 / old_speed
+        regressed = change < -threshold or allocated > old_allocated
+        if regressed:
+            regressions.append(name)
+        print(f'{name}: {change:+.1f}% ops/s, {old_allocated:.1f} -> {allocated:.1f} bytes/op'
+              + (' REGRESSION' if regressed else ''))
+    print(f'{len(regressions)} regressions')
+    return regressions
+
+
+def device_game():
+    # the same setup as the main of game.py, without starting the game
+    import game as module
+    from machine import Pin, I2C
+    import ssd1306
+    oled = ssd1306.SSD1306_I2C(128, 64, I2C(-1, scl=Pin(22), sda=Pin(21)))
+    module.game = module.CatchTheStarsGame(oled, 4, 23)
+    module.game.stop_music()
+    return (module, module.game, None)
+
+
+def host_game():
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from simulator import Simulator
+    simulator = Simulator(seed=SEED)
+    simulator.game.stop_music()
+    return (simulator.module, simulator.game, simulator)
+
+
+def main(save_to=None, compare_to=None, scale=1, only=None, threshold=THRESHOLD):
+    (module, game, simulator) = device_game() if MICROPYTHON else host_game()
+    results = run(module, game, scale, only)
+    if simulator is not None:
+        simulator.close()
+    regressions = []
+    if compare_to is not None:
+        regressions = compare(results, compare_to, threshold)
+    if save_to is not None:
+        save(results, save_to)
+    return regressions
+
+
+if __name__ == '__main__' and not MICROPYTHON:
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the game')
+    parser.add_argument('--save', help='save the results as a baseline file')
+    parser.add_argument('--compare', help='compare with a baseline file')
+    parser.add_argument('--scale', type=float, default=1, help='multiplies the duration of a timing pass')
+    parser.add_argument('--only', help='run the benchmarks whose name starts with this')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed slowdown in percent')
+    args = parser.parse_args()
+    # the simulator changes the directory
+    save_to = os.path.abspath(args.save) if args.save else None
+    compare_to = os.path.abspath(args.compare) if args.compare else None
+    if main(save_to, compare_to, args.scale, args.only, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,120 @@
+"""
+Checks the fixed point physics (Game.FIXED_POINT) against the float physics in the simulator.
+Every cue angle and speed bar value is shot with both and the positions must stay within
+--tolerance pixels at every tick, also the stars falling from every height. Prints the
+largest differences and the ticks the shots take.
+
+When a float lands within its rounding error of a wall, the float and the fixed point ball
+can bounce at different ticks. A shot off the float path fails, its message also gives the
+distance to a run with exact fractions through the same Ball code, to tell such a shot from a
+fixed point error.
+
+    python tools/check_physics.py
+"""
+
+import argparse
+import os
+import sys
+from fractions import Fraction
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import Simulator
+
+START = (20, 40)  # CatchTheStarsGame.new_ball
+MAX_TICKS = 10000
+
+
+def fly(module, game, fixed_point, angle, speed, exact=False):
+    # positions of a shot tick by tick in pixels until the ball stops
+    ball = module.Ball(game, START[0], START[1])
+    ball.fixed_point = fixed_point
+    ball.go(angle, speed)
+    if exact:
+        # the float physics with fractions, only the speeds of the shot are the floats of go()
+        game.GRAVITY = Fraction(game.GRAVITY).limit_denominator(1000)
+        ball.energy_loss = Fraction(ball.energy_loss).limit_denominator(1000)
+        ball.x_speed = Fraction(ball.x_speed)
+        ball.y_speed = Fraction(ball.y_speed)
+    stopped = []
+    game.ball_stopped = lambda: stopped.append(True)
+    path = []
+    while not stopped:
+        ball.tick()
+        if fixed_point:
+            path.append((module.Fixed.to_float(ball.x_fp), module.Fixed.to_float(ball.y_fp)))
+        else:
+            path.append((ball.x, ball.y))
+        if len(path) == MAX_TICKS:
+            raise RuntimeError(f'angle {angle} speed {speed} is still moving after {MAX_TICKS} ticks')
+    game.__dict__.pop('GRAVITY', None)
+    return path
+
+
+def fall(module, game, fixed_point, y):
+    star = module.Star(game, 64, y)
+    star.fixed_point = fixed_point
+    star.fall()
+    path = []
+    while star.falling:
+        star.tick()
+        path.append(module.Fixed.to_float(star.y_fp) if fixed_point else star.y)
+    return path
+
+
+def difference(path_a, path_b):
+    # largest distance between the paths, a path that ends first stays where it ended
+    largest = 0
+    for i in range(max(len(path_a), len(path_b))):
+        a = path_a[min(i, len(path_a) - 1)]
+        b = path_b[min(i, len(path_b) - 1)]
+        if isinstance(a, tuple):
+            largest = max(largest, abs(a[0] - b[0]), abs(a[1] - b[1]))
+        else:
+            largest = max(largest, abs(a - b))
+    return largest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the fixed point physics with the float physics')
+    parser.add_argument('--tolerance', type=float, default=1, help='allowed difference in pixels')
+    args = parser.parse_args()
+
+    simulator = Simulator()
+    (module, game) = (simulator.module, simulator.game)
+    game.stop_music()
+    game.buzzer.mute = True
+    cue = module.Cue
+    failed = 0
+    (worst, worst_shot, ticks) = (0, None, [])
+    for angle in range(cue.MAX_ANGLE, cue.MIN_ANGLE + 1, cue.ANGLE_STEP):
+        for speed in range(module.Bar(game, 0, 0).max_value + 1):
+            float_path = fly(module, game, False, angle, speed)
+            fixed_path = fly(module, game, True, angle, speed)
+            ticks.append(len(float_path))
+            diff = difference(float_path, fixed_path)
+            if diff > args.tolerance:
+                failed += 1
+                exact_diff = difference(fly(module, game, False, angle, speed, exact=True), fixed_path)
+                print(f'angle {angle} speed {speed}: {diff:.3f} pixels off the float path, '
+                      f'{exact_diff:.4f} off the exact path')
+            if diff > worst:
+                (worst, worst_shot) = (diff, (angle, speed))
+    print(f'{len(ticks)} shots of {min(ticks)} to {max(ticks)} ticks, fixed point at most {worst:.4f} pixels off '
+          f'(angle {worst_shot[0]} speed {worst_shot[1]})')
+
+    worst_fall = 0
+    for y in range(game.display.height):
+        diff = difference(fall(module, game, False, y), fall(module, game, True, y))
+        worst_fall = max(worst_fall, diff)
+        if diff > args.tolerance:
+            failed += 1
+            print(f'star falling from {y}: {diff:.3f} pixels off')
+    print(f'falling stars at most {worst_fall:.4f} pixels off')
+    simulator.close()
+    if failed:
+        sys.exit(f'FAIL: {failed} paths differ by more than {args.tolerance} pixels')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Checks the display pipeline (Game(pipelined=True)) in the simulator, where the worker is a
+regular thread. The same scripted game is played with and without the pipeline, every frame
+that reached the panel must be the same. Also prints how long both runs took on the host.
+
+    python tools/check_pipeline.py --ms 20000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import Simulator
+
+# splash, main menu, instructions, then shots with different angles
+PRESSES = [(1500, 400), (3000, 400), (4500, 100), (6000, 100), (7500, 100), (9000, 60), (10000, 400),
+           (16000, 60), (16500, 60), (17000, 400), (24000, 60), (25000, 400)]
+
+
+def play(pipelined, duration_ms, seed):
+    sim = Simulator(seed=seed, pipelined=pipelined)
+    sim.script(PRESSES)
+    start = time.perf_counter()
+    sim.run(duration_ms)
+    elapsed = time.perf_counter() - start
+    sim.close()
+    return (sim, elapsed)
+
+
+def same(frame_a, frame_b):
+    # frames are NumPy arrays or lists of rows
+    if hasattr(frame_a, 'tolist'):
+        return frame_a.tolist() == frame_b.tolist()
+    return frame_a == frame_b
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the game with and without the display pipeline')
+    parser.add_argument('--ms', type=int, default=30000, help='game time to play in ms')
+    parser.add_argument('--seed', type=int, default=1, help='seed of random')
+    args = parser.parse_args()
+
+    (direct, direct_time) = play(False, args.ms, args.seed)
+    (pipelined, pipelined_time) = play(True, args.ms, args.seed)
+    print(f'direct: {direct.draws} frames in {direct_time:.2f} s, pipelined: {pipelined.draws} frames '
+          f'in {pipelined_time:.2f} s, {pipelined.game.pipeline.frames} sent by the worker')
+    if len(direct.frames) != len(pipelined.frames):
+        sys.exit('FAIL: the number of frames differs')
+    for (number, ((time_a, frame_a), (time_b, frame_b))) in enumerate(zip(direct.frames, pipelined.frames)):
+        if time_a != time_b or not same(frame_a, frame_b):
+            sys.exit(f'FAIL: frame {number} at {time_a // 1000} ms differs')
+    if direct.game.score.value != pipelined.game.score.value:
+        sys.exit('FAIL: the score differs')
+    print(f'OK: all {len(direct.frames)} frames are the same, score {direct.game.score.value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Checks that a recorded session replays to the same frames (Game.record and Game.replay). The
+scripted game of check_pipeline.py is recorded in the simulator, then the recording is played
+in a new simulator with another seed of random, and every frame must be the same.
+
+    python tools/check_replay.py --ms 30000 --keep session.rec
+
+The replay can also be checked against a recording made on the device, --frames saves the
+frames of the replay as PNG files to compare them with the screen.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import Simulator
+from check_pipeline import PRESSES, same
+
+
+def record(file, duration_ms, seed):
+    sim = Simulator(seed=seed, record=file)
+    sim.script(PRESSES)
+    sim.run(duration_ms)
+    sim.stop_recording()
+    sim.close()
+    return sim
+
+
+def replay(file, duration_ms, seed, pipelined):
+    sim = Simulator(seed=seed, replay=file, pipelined=pipelined)
+    start = time.perf_counter()
+    sim.run(duration_ms)
+    elapsed = time.perf_counter() - start
+    sim.close()
+    return (sim, elapsed)
+
+
+def score(sim):
+    # no score before the first game
+    return sim.game.score.value if hasattr(sim.game, 'score') else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a scripted game and check its replay')
+    parser.add_argument('--ms', type=int, default=30000, help='game time to record in ms')
+    parser.add_argument('--seed', type=int, default=1, help='seed of random for the recording')
+    parser.add_argument('--keep', help='keep the recording in this file')
+    parser.add_argument('--replay', help='only replay this recording, e.g. one made on the device')
+    parser.add_argument('--frames', help='directory for the PNG frames of the replay')
+    parser.add_argument('--pipelined', action='store_true', help='replay with the display pipeline')
+    args = parser.parse_args()
+
+    if args.replay:
+        (sim, elapsed) = replay(os.path.abspath(args.replay), 24 * 3600 * 1000, args.seed, args.pipelined)
+        print(f'replayed {sim.game.tick_count} ticks, {len(sim.frames)} frames in {elapsed:.2f} s, '
+              f'score {score(sim)}')
+        if args.frames:
+            print(f'saved {len(sim.save_frames(args.frames))} frames to {args.frames}')
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = os.path.abspath(args.keep) if args.keep else os.path.join(directory, 'session.rec')
+        recorded = record(file, args.ms, args.seed)
+        # the seed of random must not matter, it comes from the recording
+        (replayed, elapsed) = replay(file, args.ms * 2, args.seed + 1, args.pipelined)
+        print(f'recorded {recorded.game.tick_count} ticks and {len(recorded.frames)} frames '
+              f'({os.path.getsize(file)} bytes), replayed {len(replayed.frames)} frames in {elapsed:.2f} s')
+    if len(recorded.frames) != len(replayed.frames):
+        sys.exit('FAIL: the number of frames differs')
+    for (number, ((time_a, frame_a), (time_b, frame_b))) in enumerate(zip(recorded.frames, replayed.frames)):
+        if not same(frame_a, frame_b):
+            sys.exit(f'FAIL: frame {number} at {time_a // 1000} ms differs')
+    if score(recorded) != score(replayed):
+        sys.exit('FAIL: the score differs')
+    if args.frames:
+        print(f'saved {len(replayed.save_frames(args.frames))} frames to {args.frames}')
+    print(f'OK: all {len(recorded.frames)} frames are the same, score {score(recorded)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Compiles sprite sheets (PBM or PNG) into atlas files that the game loads with Utils.load_atlas.
+
+Run it on the host with CPython:
+    python tools/compile_assets.py --vlsb -o src/images src/images/bird.pbm:8 src/images/cat.pbm:6
+
+Every sheet is given as file:number_of_frames. The frames are laid out next to each other
+horizontally, like Utils.load_animation expects them. PNG files need Pillow.
+
+Atlas format (little endian):
+    magic 'ATL1', layout (0 = MONO_HLSB, 1 = MONO_VLSB), flags (bit 0: mirrored frames follow),
+    number of frames, reserved byte, frame width (uint16), frame height (uint16)
+    followed by the frames one after the other and then the mirrored frames in the same order.
+"""
+
+import argparse
+import os
+import struct
+import sys
+
+MAGIC = b'ATL1'
+HEADER = '<4sBBBBHH'
+LAYOUT_HLSB = 0
+LAYOUT_VLSB = 1
+FLAG_MIRRORED = 1
+
+
+def load_pbm(file):
+    # returns (width, height, rows) where rows is a list of lists of 0/1 pixels, 1 is lit on the display
+    with open(file, 'rb') as f:
+        data = f.read()
+    fields = []
+    pos = 0
+    while len(fields) < 3:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos)
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    pos += 1  # single whitespace before the raster
+    magic, width, height = fields[0], int(fields[1]), int(fields[2])
+    if magic != b'P4':
+        raise ValueError(f'{file}: only binary PBM (P4) files are supported')
+    stride = (width + 7) // 8
+    rows = []
+    for y in range(height):
+        row = data[pos + y * stride:pos + (y + 1) * stride]
+        rows.append([(row[x >> 3] >> (7 - (x & 7))) & 1 for x in range(width)])
+    return (width, height, rows)
+
+
+def load_png(file):
+    try:
+        from PIL import Image
+    except ImportError:
+        sys.exit(f'{file}: reading PNG files needs Pillow (pip install pillow)')
+    image = Image.open(file).convert('L')
+    width, height = image.size
+    pixels = image.load()
+    # dark pixels are lit, the same as in the PBM files
+    rows = [[1 if pixels[x, y] < 128 else 0 for x in range(width)] for y in range(height)]
+    return (width, height, rows)
+
+
+def load_sheet(file):
+    if file.lower().endswith('.png'):
+        return load_png(file)
+    return load_pbm(file)
+
+
+def split_frames(width, height, rows, num_frames):
+    if width % num_frames:
+        raise ValueError(f'sheet width {width} is not a multiple of {num_frames} frames')
+    frame_width = width // num_frames
+    return [[row[i * frame_width:(i + 1) * frame_width] for row in rows] for i in range(num_frames)]
+
+
+def mirror(frame):
+    return [row[::-1] for row in frame]
+
+
+def pack_hlsb(frame):
+    width = len(frame[0])
+    stride = (width + 7) // 8
+    out = bytearray(stride * len(frame))
+    for y, row in enumerate(frame):
+        for x, pixel in enumerate(row):
+            if pixel:
+                out[y * stride + (x >> 3)] |= 0x80 >> (x & 7)
+    return out
+
+
+def pack_vlsb(frame):
+    width = len(frame[0])
+    out = bytearray(width * ((len(frame) + 7) // 8))
+    for y, row in enumerate(frame):
+        for x, pixel in enumerate(row):
+            if pixel:
+                out[(y >> 3) * width + x] |= 1 << (y & 7)
+    return out
+
+
+def compile_atlas(file, num_frames, vlsb=False, mirrored=True):
+    (width, height, rows) = load_sheet(file)
+    frames = split_frames(width, height, rows, num_frames)
+    if mirrored:
+        frames = frames + [mirror(frame) for frame in frames]
+    pack = pack_vlsb if vlsb else pack_hlsb
+    header = struct.pack(HEADER, MAGIC, LAYOUT_VLSB if vlsb else LAYOUT_HLSB,
+                         FLAG_MIRRORED if mirrored else 0, num_frames, 0, width // num_frames, height)
+    return header + b''.join(pack(frame) for frame in frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile sprite sheets into atlas files')
+    parser.add_argument('sheets', nargs='+', help='sprite sheet as file:number_of_frames')
+    parser.add_argument('-o', '--output', default='.', help='output directory')
+    parser.add_argument('--vlsb', action='store_true', help='store frames in the MONO_VLSB layout of the SSD1306')
+    parser.add_argument('--no-mirror', action='store_true', help="don't add mirrored frames")
+    args = parser.parse_args()
+
+    for sheet in args.sheets:
+        (file, _, num_frames) = sheet.rpartition(':')
+        if not file:
+            parser.error(f'{sheet}: number of frames is missing')
+        atlas = compile_atlas(file, int(num_frames), args.vlsb, not args.no_mirror)
+        name = os.path.splitext(os.path.basename(file))[0] + '.atl'
+        with open(os.path.join(args.output, name), 'wb') as f:
+            f.write(atlas)
+        print(f'{file} -> {name}: {num_frames} frames, {len(atlas)} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Makes a level pack for the game: the star positions of many levels in a small binary file.
+The game plays the levels of levels.lvl in order when the file is uploaded, so starting a level
+costs almost nothing and the same levels can be played again.
+
+The levels are made with the game's own generator from a seed, so the same seed always gives
+the same pack:
+    python tools/compile_levels.py -o levels.lvl --count 100 --seed 1
+With --max-balls only levels that can be cleared with that many balls are kept (needs NumPy,
+see level_solver.py):
+    python tools/compile_levels.py -o levels.lvl --count 100 --seed 1 --max-balls 2
+"""
+
+import argparse
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import Simulator
+
+MAGIC = b'LVL1'
+MAX_SEEDS = 100  # seeds tried before giving up, every seed gives --count levels to choose from
+
+
+def pack_file(levels, stars):
+    data = bytearray(struct.pack('<4sHBB', MAGIC, len(levels), stars, 0))
+    for level in levels:
+        for (x, y) in level:
+            data.extend(bytes((x, y)))
+    return bytes(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make a level pack')
+    parser.add_argument('-o', '--output', default='levels.lvl', help='output file')
+    parser.add_argument('--count', type=int, default=100, help='number of levels')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the level generator')
+    parser.add_argument('--max-balls', type=int, help='keep only the levels that can be cleared with this many balls')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)  # the simulator changes the directory
+    if args.count < 1:
+        parser.error('--count must be at least 1')
+
+    with Simulator(seed=args.seed) as simulator:
+        game = simulator.game
+        game.stop_music()
+        game.level_pack = None
+        game.rng.seed(args.seed)
+        stars = game.NUM_STARS
+        if args.max_balls is None:
+            levels = []
+            tried = 0
+            while len(levels) < args.count:
+                if tried == MAX_SEEDS * args.count:
+                    sys.exit(f'only {len(levels)} of {tried} generated levels have {stars} stars')
+                level = game.star_positions(len(levels))
+                tried = tried + 1
+                if len(level) == stars:
+                    levels.append(level)
+        else:
+            import level_solver
+            rules = level_solver.Rules(simulator.module, game)
+            table = level_solver.catch_table(rules, level_solver.trajectories(rules))
+            levels = []
+            tried = 0
+            while len(levels) < args.count:
+                if tried == MAX_SEEDS:
+                    sys.exit(f'only {len(levels)} of {tried * args.count} levels can be cleared with '
+                             f'{args.max_balls} balls, try fewer levels or more balls')
+                layouts = level_solver.make_layouts(game, args.count, args.seed + tried)
+                tried = tried + 1
+                (best, clear) = level_solver.solve(rules, level_solver.shot_masks(rules, table, layouts))
+                for (layout, balls) in zip(layouts.tolist(), clear.tolist()):
+                    if 0 < balls <= args.max_balls and len(levels) < args.count:
+                        levels.append([tuple(star) for star in layout])
+
+    with open(output, 'wb') as f:
+        f.write(pack_file(levels, stars))
+    print(f'{len(levels)} levels with {stars} stars -> {args.output} ({os.path.getsize(output)} bytes)')
+
+
+if __name__ == '__main__':
+    main()
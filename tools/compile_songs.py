@@ -0,0 +1,82 @@
+"""
+Compiles onlinesequencer.net song strings into binary song files for buzzer_music.
+A compiled file is loaded on the device with songs.load_song without any parsing:
+    music(load_song('music.bzm'), pins=[Pin(23)])
+The game plays the files of its songs (CatchTheStarsGame.SONG_FILES) when they are uploaded and
+were compiled from the same song strings, a file keeps the crc32 of its song string.
+Every file is loaded again after writing it and must give the same song.
+
+Run it on the host with CPython, either with songs given as name=song_string:
+    python tools/compile_songs.py -o . 'beep=0 E5 1 0;2 G5 1 0'
+or with --game to compile the MUSIC and SOUND_* songs of the game:
+    python tools/compile_songs.py -o . --game src/game.py
+"""
+
+import argparse
+import ast
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Upload_these_to_device'))
+from songs import MAGIC, parse_song, load_song, source_crc
+
+
+def to_bytes(values):
+    values = values.__copy__()
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def song_file(song, song_string):
+    header = struct.pack('<4sHHHI', MAGIC, song.end, song.beats, len(song.freqs), source_crc(song_string))
+    return header + to_bytes(song.starts) + to_bytes(song.freqs) + to_bytes(song.durations)
+
+
+def same_song(a, b):
+    return (a.end == b.end and list(a.starts) == list(b.starts) and list(a.freqs) == list(b.freqs)
+            and list(a.durations) == list(b.durations))
+
+
+def game_songs(file):
+    # the MUSIC and SOUND_* string constants of the game classes
+    with open(file) as f:
+        tree = ast.parse(f.read())
+    songs = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and (target.id == 'MUSIC' or target.id.startswith('SOUND_')):
+                    songs.append((target.id.lower(), node.value.value))
+    return songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile song strings into binary song files')
+    parser.add_argument('songs', nargs='*', help='song as name=song_string')
+    parser.add_argument('-o', '--output', default='.', help='output directory')
+    parser.add_argument('--game', help='compile the MUSIC and SOUND_* songs of this game file')
+    args = parser.parse_args()
+
+    songs = game_songs(args.game) if args.game else []
+    for song in args.songs:
+        (name, _, song_string) = song.partition('=')
+        if not song_string:
+            parser.error(f'{song}: expected name=song_string')
+        songs.append((name, song_string))
+    if not songs:
+        parser.error('no songs to compile')
+
+    for (name, song_string) in songs:
+        song = parse_song(song_string)
+        file = os.path.join(args.output, name + '.bzm')
+        with open(file, 'wb') as f:
+            f.write(song_file(song, song_string))
+        if not same_song(load_song(file, song_string), song):
+            sys.exit(f'{file}: the loaded song differs from {name}')
+        print(f'{name}: {len(song.freqs)} notes, {song.end} beats -> {file} ({os.path.getsize(file)} bytes)')
+
+
+if __name__ == '__main__':
+    main()
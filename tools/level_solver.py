@@ -0,0 +1,301 @@
+"""
+Finds out how hard the levels of the game are: which shots catch which stars and the best
+score a player can make on a level. Needs NumPy.
+
+    python tools/level_solver.py --layouts 10000 --seed 1
+    python tools/level_solver.py --layouts 200 --verify --csv levels.csv
+
+A shot is one of the 8 cue angles and one of the 8 speed bar values (0 to 7), shot from (20, 40).
+All 64 trajectories are simulated together as NumPy arrays with the exact operations of
+Ball.tick, the integer ones of Ball.tick_fixed when the game uses fixed point physics, and
+every move of the ball is checked like CollisionGrid.query does. As the ball
+doesn't depend on the stars, this gives a table of the shots that catch a star at every position
+a star can have. The layouts come from CatchTheStarsGame.star_positions, so they are the levels
+of the game, and all of them are looked up in the table at once.
+
+The best score of a layout is the most points NUM_BALLS balls can make on it. A ball that
+catches k stars makes 1 + 2 + ... + k points. --verify runs the game's own Ball and
+CollisionGrid in the simulator and checks that the solver gets the same results.
+"""
+
+import argparse
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    sys.exit('level_solver.py needs NumPy: pip install numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import Simulator
+
+START = (20, 40)  # CatchTheStarsGame.new_ball
+MAX_TICKS = 10000
+
+
+class Rules:
+    # the numbers of the game, read from the game itself
+    def __init__(self, module, game):
+        ball = module.Ball(game, START[0], START[1])
+        self.fixed_point = ball.fixed_point
+        self.one = module.Fixed.ONE
+        self.half = module.Fixed.HALF
+        if self.fixed_point:
+            self.gravity = ball.gravity_fp
+            self.energy_loss = ball.energy_loss_fp
+            (self.floor, self.right, self.left) = (ball.floor_fp, ball.right_fp, ball.left_fp)
+        else:
+            self.gravity = game.GRAVITY
+            self.energy_loss = ball.energy_loss
+            self.floor = ball.close_to(game.display.height)
+            self.right = ball.close_to(game.display.width)
+            self.left = ball.close_to(0)
+        self.radius = ball.RADIUS * 2  # check_collisions
+        cue = module.Cue
+        self.angles = list(range(cue.MAX_ANGLE, cue.MIN_ANGLE + 1, cue.ANGLE_STEP))
+        self.speeds = list(range(module.Bar(game, 0, 0).max_value + 1))
+        self.shots = [(angle, speed) for angle in self.angles for speed in self.speeds]
+        # initial speeds from Ball.go itself
+        self.x_speeds = []
+        self.y_speeds = []
+        for (angle, speed) in self.shots:
+            ball.go(angle, speed)
+            self.x_speeds.append(ball.x_speed_fp if self.fixed_point else ball.x_speed)
+            self.y_speeds.append(ball.y_speed_fp if self.fixed_point else ball.y_speed)
+        self.num_balls = game.NUM_BALLS
+        self.num_stars = game.NUM_STARS
+        # every position star_positions can give
+        layout = game.star_layout
+        self.star_x = range(layout.x0, layout.x1 + 1)
+        self.star_y = range(layout.y0, layout.y1 + 1)
+
+
+def trajectories(rules):
+    # Simulates all shots at once. Returns one (x0, y0, x1, y1) array per shot with the moves
+    # that check_collisions checks, that is every tick except the one in which the ball stops.
+    if rules.fixed_point:
+        return fixed_trajectories(rules)
+    shots = len(rules.shots)
+    x = numpy.full(shots, float(START[0]))
+    y = numpy.full(shots, float(START[1]))
+    x_speed = numpy.array(rules.x_speeds, dtype=numpy.float64)
+    y_speed = numpy.array(rules.y_speeds, dtype=numpy.float64)
+    moving = numpy.ones(shots, dtype=bool)
+    history = []  # (prev_x, prev_y, x, y, moving) of every tick
+    for tick in range(MAX_TICKS):
+        if not moving.any():
+            break
+        prev_x = x.copy()
+        prev_y = y.copy()
+        # same operations in the same order as Ball.tick
+        y = numpy.where(moving, y + y_speed, y)
+        y_speed = numpy.where(moving, y_speed + rules.gravity, y_speed)
+        stopped = moving & (y >= rules.floor) & (numpy.abs(x_speed) < 1) & (numpy.abs(y_speed) < 1)
+        y = numpy.where(stopped, rules.floor - 1, y)
+        moving = moving & ~stopped
+        bounce = moving & (y >= rules.floor)
+        y = numpy.where(bounce, rules.floor, y)
+        y_speed = numpy.where(bounce, -y_speed * rules.energy_loss, y_speed)
+        x_speed = numpy.where(bounce, x_speed * rules.energy_loss, x_speed)
+        x = numpy.where(moving, x + x_speed, x)
+        wall = moving & (x >= rules.right)
+        x = numpy.where(wall, rules.right, x)
+        x_speed = numpy.where(wall, -x_speed, x_speed)
+        wall = moving & (x < rules.left)
+        x = numpy.where(wall, rules.left, x)
+        x_speed = numpy.where(wall, -x_speed, x_speed)
+        history.append(numpy.stack((prev_x, prev_y, x, y, moving)))
+    else:
+        raise RuntimeError(f'a ball is still moving after {MAX_TICKS} ticks')
+    history = numpy.array(history)  # tick, value, shot
+    return [history[history[:, 4, shot] > 0, :4, shot] for shot in range(shots)]
+
+
+def fixed_trajectories(rules):
+    # trajectories() with the integer operations of Ball.tick_fixed, the moves are in pixels
+    shots = len(rules.shots)
+    one = rules.one
+    x_fp = numpy.full(shots, START[0] * one, dtype=numpy.int64)
+    y_fp = numpy.full(shots, START[1] * one, dtype=numpy.int64)
+    x_speed = numpy.array(rules.x_speeds, dtype=numpy.int64)
+    y_speed = numpy.array(rules.y_speeds, dtype=numpy.int64)
+    x = numpy.full(shots, START[0], dtype=numpy.int64)
+    y = numpy.full(shots, START[1], dtype=numpy.int64)
+    moving = numpy.ones(shots, dtype=bool)
+    history = []
+    for tick in range(MAX_TICKS):
+        if not moving.any():
+            break
+        prev_x = x.copy()
+        prev_y = y.copy()
+        y_fp = numpy.where(moving, y_fp + y_speed, y_fp)
+        y_speed = numpy.where(moving, y_speed + rules.gravity, y_speed)
+        stopped = (moving & (y_fp >= rules.floor) & (numpy.abs(x_speed) < one) & (numpy.abs(y_speed) < one))
+        moving = moving & ~stopped
+        bounce = moving & (y_fp >= rules.floor)
+        y_fp = numpy.where(bounce, rules.floor, y_fp)
+        y_speed = numpy.where(bounce, (-y_speed * rules.energy_loss + rules.half) // one, y_speed)
+        x_speed = numpy.where(bounce, (x_speed * rules.energy_loss + rules.half) // one, x_speed)
+        x_fp = numpy.where(moving, x_fp + x_speed, x_fp)
+        wall = moving & (x_fp >= rules.right)
+        x_fp = numpy.where(wall, rules.right, x_fp)
+        x_speed = numpy.where(wall, -x_speed, x_speed)
+        wall = moving & (x_fp < rules.left)
+        x_fp = numpy.where(wall, rules.left, x_fp)
+        x_speed = numpy.where(wall, -x_speed, x_speed)
+        x = numpy.where(moving, x_fp // one, x)
+        y = numpy.where(moving, y_fp // one, y)
+        history.append(numpy.stack((prev_x, prev_y, x, y, moving)))
+    else:
+        raise RuntimeError(f'a ball is still moving after {MAX_TICKS} ticks')
+    history = numpy.array(history)
+    return [history[history[:, 4, shot] > 0, :4, shot] for shot in range(shots)]
+
+
+def catch_table(rules, moves):
+    # caught[shot, x, y] is True when the shot catches a star at (x, y). The distance of every
+    # star position to every move is computed like CollisionGrid.query.
+    (star_x, star_y) = numpy.meshgrid(numpy.array(rules.star_x), numpy.array(rules.star_y), indexing='ij')
+    star_x = star_x.reshape(-1, 1)
+    star_y = star_y.reshape(-1, 1)
+    radius2 = rules.radius * rules.radius
+    caught = numpy.zeros((len(moves), star_x.shape[0]), dtype=bool)
+    for (shot, segments) in enumerate(moves):
+        if len(segments) == 0:
+            continue
+        (x0, y0, x1, y1) = segments.T
+        dx = x1 - x0
+        dy = y1 - y0
+        length2 = dx * dx + dy * dy
+        px = star_x - x0
+        py = star_y - y0
+        moved = length2 > 0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t = (px * dx + py * dy) / length2
+        t = numpy.where(t > 1, 1, numpy.where(t < 0, 0, t))
+        px = numpy.where(moved, px - t * dx, px)
+        py = numpy.where(moved, py - t * dy, py)
+        caught[shot] = (px * px + py * py <= radius2).any(axis=1)
+    return caught.reshape(len(moves), len(rules.star_x), len(rules.star_y))
+
+
+def make_layouts(game, count, seed):
+    # generated levels of the game, levels with fewer stars than NUM_STARS are left out
+    game.level_pack = None
+    game.rng.seed(seed)
+    layouts = [game.star_positions(level) for level in range(count)]
+    return numpy.array([layout for layout in layouts if len(layout) == game.NUM_STARS], dtype=numpy.int64)
+
+
+def shot_masks(rules, table, layouts):
+    # masks[layout, shot] has bit i set when the shot catches star i of the layout
+    x = layouts[:, :, 0] - rules.star_x[0]
+    y = layouts[:, :, 1] - rules.star_y[0]
+    hits = table[:, x, y]  # shot, layout, star
+    weights = 1 << numpy.arange(layouts.shape[1])
+    return (hits * weights).sum(axis=2).T
+
+
+def solve(rules, masks):
+    # best score with num_balls balls and the fewest balls that catch every star, per layout
+    (layouts, shots) = masks.shape
+    states = 1 << rules.num_stars
+    remaining = numpy.arange(states)
+    counts = numpy.array([bin(m).count('1') for m in range(states)])
+    points = counts * (counts + 1) // 2  # 1 + 2 + ... + k for k stars with one ball
+    best = numpy.zeros((layouts, states), dtype=numpy.int64)
+    balls = numpy.where(remaining == 0, 0, rules.num_balls + 1)[None, :].repeat(layouts, axis=0)
+    for ball in range(rules.num_balls):
+        new_best = best.copy()
+        new_balls = balls.copy()
+        for shot in range(shots):
+            hit = masks[:, shot][:, None]
+            left = remaining[None, :] & ~hit
+            score = points[remaining[None, :] & hit] + numpy.take_along_axis(best, left, axis=1)
+            new_best = numpy.maximum(new_best, score)
+            new_balls = numpy.minimum(new_balls, numpy.take_along_axis(balls, left, axis=1) + 1)
+        (best, balls) = (new_best, new_balls)
+    full = states - 1
+    clear = balls[:, full]
+    return (best[:, full], numpy.where(clear > rules.num_balls, -1, clear))
+
+
+def verify(module, game, rules, moves, layouts, masks):
+    # runs the game's Ball and CollisionGrid on every shot and compares
+    ball = module.Ball(game, START[0], START[1])
+    stopped = []
+    game.ball_stopped = lambda: stopped.append(True)
+    game.buzzer.mute = True
+    for (shot, (angle, speed)) in enumerate(rules.shots):
+        ball.reset(START[0], START[1])
+        ball.go(angle, speed)
+        del stopped[:]
+        expected = []
+        while not stopped:
+            ball.tick()
+            if not stopped:
+                expected.append((ball.prev_x, ball.prev_y, ball.x, ball.y))
+        if expected != [tuple(m) for m in moves[shot].tolist()]:
+            raise AssertionError(f'trajectory of angle {angle} speed {speed} differs from Ball.tick')
+    grid = module.CollisionGrid(game.display.width, game.display.height)
+    for (number, layout) in enumerate(layouts):
+        grid.clear()
+        stars = [module.Star(game, int(x), int(y)) for (x, y) in layout]
+        for star in stars:
+            grid.add(star)
+        for shot in range(len(rules.shots)):
+            hits = []
+            for (x0, y0, x1, y1) in moves[shot].tolist():
+                grid.query(x0, y0, x1, y1, rules.radius, hits)
+            mask = sum(1 << stars.index(star) for star in set(hits))
+            if mask != masks[number, shot]:
+                raise AssertionError(f'layout {number} shot {rules.shots[shot]}: grid {mask}, solver {masks[number, shot]}')
+    print(f'verified: {len(rules.shots)} trajectories and {len(layouts)} layouts match the game')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Catchable stars and best scores of random levels')
+    parser.add_argument('--layouts', type=int, default=10000, help='number of random levels')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the level generator')
+    parser.add_argument('--csv', help='write the results of every layout to this file')
+    parser.add_argument('--verify', action='store_true', help='check the solver against the game code')
+    args = parser.parse_args()
+    csv = os.path.abspath(args.csv) if args.csv else None  # the simulator changes the directory
+
+    simulator = Simulator(seed=args.seed)
+    (module, game) = (simulator.module, simulator.game)
+    game.stop_music()
+    rules = Rules(module, game)
+    moves = trajectories(rules)
+    table = catch_table(rules, moves)
+    layouts = make_layouts(game, args.layouts, args.seed)
+    masks = shot_masks(rules, table, layouts)
+    (best, clear) = solve(rules, masks)
+    if args.verify:
+        verify(module, game, rules, moves, layouts[:200], masks[:200])
+    simulator.close()
+
+    weights = 1 << numpy.arange(rules.num_stars)
+    catchable = ((numpy.bitwise_or.reduce(masks, axis=1)[:, None] & weights) > 0).sum(axis=1)
+    ticks = [len(m) for m in moves]
+    print(f'{len(rules.shots)} shots, {min(ticks)} to {max(ticks)} ticks per shot, '
+          f'{table.any(axis=0).mean() * 100:.1f}% of the star positions can be caught')
+    print(f'{len(layouts)} layouts, best score {best.mean():.2f} on average (max {best.max()})')
+    for count in range(rules.num_stars + 1):
+        print(f'  {count} catchable stars: {(catchable == count).mean() * 100:.1f}%')
+    for balls in range(1, rules.num_balls + 1):
+        print(f'  cleared with {balls} balls: {(clear == balls).mean() * 100:.1f}%')
+    print(f'  can\'t be cleared: {(clear < 0).mean() * 100:.1f}%')
+
+    if csv:
+        with open(csv, 'w') as f:
+            f.write('layout,stars,catchable,best_score,balls_to_clear\n')
+            for number in range(len(layouts)):
+                stars = ' '.join(f'{x}:{y}' for (x, y) in layouts[number])
+                f.write(f'{number},{stars},{catchable[number]},{best[number]},{clear[number]}\n')
+        print(f'wrote {args.csv}')
+
+
+if __name__ == '__main__':
+    main()